@@ -1,10 +1,14 @@
-from .FluxPseudoNegative import FluxPseudoNegativeNode
+from .FluxPseudoNegative import FluxPseudoNegativeNode, FluxPseudoNegativeBatchNode, FluxPseudoNegativeConditioningNode
 NODE_CLASS_MAPPINGS = {
-    "FluxPseudoNegativeNode": FluxPseudoNegativeNode
+    "FluxPseudoNegativeNode": FluxPseudoNegativeNode,
+    "FluxPseudoNegativeBatchNode": FluxPseudoNegativeBatchNode,
+    "FluxPseudoNegativeConditioningNode": FluxPseudoNegativeConditioningNode
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "FluxPseudoNegativeNode": "Flux Pseudo Negative"
+    "FluxPseudoNegativeNode": "Flux Pseudo Negative",
+    "FluxPseudoNegativeBatchNode": "Flux Pseudo Negative (Batch)",
+    "FluxPseudoNegativeConditioningNode": "Flux Pseudo Negative (Conditioning)"
 }
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
\ No newline at end of file
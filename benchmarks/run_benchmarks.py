@@ -0,0 +1,323 @@
+# benchmarks/run_benchmarks.py
+#
+# Reproducible benchmarks for the negative-to-positive conversion pipeline.
+#
+#     python benchmarks/run_benchmarks.py                      # run and print a report
+#     python benchmarks/run_benchmarks.py --save-baseline      # store results as the baseline
+#     python benchmarks/run_benchmarks.py --compare            # fail (exit 1) on regressions
+#     python benchmarks/run_benchmarks.py --fill-mask-backend onnx-int8   # benchmark another backend
+#
+# ConceptNet is served by an in-process stub and the fill-mask model defaults to a tiny
+# random BERT, so numbers measure this package rather than the network or a 400 MB model.
+# Run `python install.py` first so the NLTK data and WordNet index are available.
+#
+# The baseline is not checked in: timings only compare against a baseline recorded on the
+# same machine with the same Python, model and backend, so record it locally, e.g. on the
+# main branch before a change, and compare the change against it.
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(HERE, "corpus.json")
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+PACKAGE_NAME = "flux_pseudo_negative"
+TINY_FILL_MASK_MODEL = "hf-internal-testing/tiny-random-BertForMaskedLM"
+COMPLEXITIES = ["basic", "advanced", "expert"]
+DICTIONARY_ENTRIES = 20000  # size of the generated shop-wide custom dictionary
+INCREMENTAL_EDIT = "washed out colors"  # tag swapped into each prompt for the incremental benchmarks
+
+
+def load_package():
+    """Import the node package from the repository root under a fixed module name."""
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(ROOT, "__init__.py"),
+                                                  submodule_search_locations=[ROOT])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+def measure_import_ms(runs=5):
+    """Median cold import time of the package, each in a fresh interpreter."""
+    code = ("import sys, time, importlib.util\n"
+            f"spec = importlib.util.spec_from_file_location({PACKAGE_NAME!r}, {os.path.join(ROOT, '__init__.py')!r}, "
+            f"submodule_search_locations=[{ROOT!r}])\n"
+            "module = importlib.util.module_from_spec(spec)\n"
+            f"sys.modules[{PACKAGE_NAME!r}] = module\n"
+            "start = time.perf_counter()\n"
+            "spec.loader.exec_module(module)\n"
+            "print((time.perf_counter() - start) * 1000)\n")
+    timings = [float(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                                    text=True).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    return statistics.median(timings)
+
+
+class _ConceptNetStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        term = self.path.rstrip("/").rsplit("/", 1)[-1]
+        edges = [{"rel": {"label": "Antonym"}, "end": {"label": f"{term} opposite {i}"}} for i in range(3)]
+        edges.append({"rel": {"label": "RelatedTo"}, "end": {"label": term}})
+        body = json.dumps({"edges": edges}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_conceptnet_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ConceptNetStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def time_call(function, repeat, warmup=1, setup=None, items=1):
+    for _ in range(warmup):
+        if setup:
+            setup()
+        function()
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    return {
+        "n": repeat,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 4),
+        "throughput_per_s": round(items * repeat / total, 2) if total else None,
+    }
+
+
+def run_benchmarks(repeat, fill_mask_model, only=None, fill_mask_backend="transformers"):
+    package = load_package()
+    cache_module = sys.modules[f"{PACKAGE_NAME}.flux_cache"]
+    conceptnet_module = sys.modules[f"{PACKAGE_NAME}.flux_conceptnet"]
+    models_module = sys.modules[f"{PACKAGE_NAME}.flux_models"]
+
+    server = start_conceptnet_stub()
+    conceptnet_module.set_conceptnet_backend(
+        conceptnet_module.HttpConceptNetBackend(base_url=f"http://127.0.0.1:{server.server_port}"))
+
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)["prompts"]
+
+    node = package.NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"]()
+    node.fill_mask_model = fill_mask_model
+    state = node.conversion_state(fill_mask_backend=fill_mask_backend)
+    state.transformer_model  # load the model and its candidate vocabulary outside the timed region
+    state.candidate_vocabulary
+    words = list(dict.fromkeys(word.strip() for prompt in corpus for tag in prompt["negative"].split(",")
+                               for word in tag.split() if word.strip().isalpha()))
+
+    agreement = None
+    if fill_mask_backend != "transformers":
+        reference = models_module.fill_mask_registry.get(fill_mask_model, node.fill_mask_device, "transformers")
+        agreement = models_module.compare_fill_mask(reference, state.transformer_model, words)
+        print(f"{'fill-mask agreement with transformers':48s} top-1 {agreement['top1_agreement']:.3f}  "
+              f"top-k {agreement['topk_overlap']:.3f}  max score delta {agreement['max_score_delta']:.4f}")
+        models_module.fill_mask_registry.unload(fill_mask_model, node.fill_mask_device, "transformers")
+
+    def clear_caches():
+        cache_module.antonym_cache.clear()
+        cache_module.result_cache.clear()
+        conceptnet_module.get_conceptnet_backend().clear_cache()
+        node.run_memo.clear()
+
+    results = {}
+
+    def bench(name, function, **kwargs):
+        if only and not any(part in name for part in only):
+            return
+        results[name] = time_call(function, repeat, **kwargs)
+        print(f"{name:48s} p50 {results[name]['p50_ms']:9.3f} ms  p95 {results[name]['p95_ms']:9.3f} ms")
+
+    for prompt in corpus:
+        for complexity in COMPLEXITIES:
+            run = (lambda prompt=prompt, complexity=complexity:
+                   node.run(prompt["negative"], prompt["positive"], 0.5, complexity, "default",
+                            fill_mask_backend=fill_mask_backend))
+            bench(f"run/{complexity}/{prompt['name']}/cold", run, setup=clear_caches)
+            bench(f"run/{complexity}/{prompt['name']}/warm", run)
+        bench(f"run/basic+conceptnet/{prompt['name']}/cold",
+              lambda prompt=prompt: node.run(prompt["negative"], prompt["positive"], 0.5, "basic", "default",
+                                             use_conceptnet=True, fill_mask_backend=fill_mask_backend),
+              setup=clear_caches)
+        # Re-queue the prompt with one tag edited after a cold run of the original
+        bench(f"run/expert/{prompt['name']}/incremental",
+              lambda prompt=prompt: node.run(edited_negative(prompt["negative"]), prompt["positive"], 0.5, "expert",
+                                             "default", fill_mask_backend=fill_mask_backend),
+              setup=lambda prompt=prompt: (clear_caches(), node.run(prompt["negative"], prompt["positive"], 0.5,
+                                                                    "expert", "default",
+                                                                    fill_mask_backend=fill_mask_backend)))
+        bench(f"replace_phrases/{prompt['name']}",
+              lambda prompt=prompt: node.phrase_handler.replace_phrases(prompt["negative"]))
+        bench(f"analyze_sentiment/{prompt['name']}",
+              lambda prompt=prompt: node.analyze_sentiment(prompt["negative"]))
+
+    # The built-in phrase and strength tables are shared, so a new node should cost next to nothing
+    bench("node/init", package.NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"])
+    for strategy in ["custom_dict_strategy", "wordnet_strategy", "nltk_strategy", "transformer_strategy"]:
+        method = getattr(node, strategy)
+        bench(f"strategy/{strategy}", lambda method=method: [method(state, word) for word in words],
+              setup=lambda: state.fill_mask_results.clear(), items=len(words))
+
+    embeddings_module = sys.modules[f"{PACKAGE_NAME}.flux_embeddings"]
+    with tempfile.TemporaryDirectory() as directory:
+        if not only or any(part in "expand_concept/embeddings" for part in only):
+            # The node never builds an embedding index, so build the benchmark model's in a temporary directory
+            embedding_engine = embeddings_module.get_embedding_engine(fill_mask_model, node.fill_mask_device)
+            embedding_engine.directory = directory
+            embedding_engine.build_index()
+        for engine in ["fill_mask", "embeddings"]:
+            def expand(engine=engine):
+                # Query embeddings stay cached after the first (warmup) call
+                expand_state = node.conversion_state(fill_mask_backend=fill_mask_backend, expansion_engine=engine)
+                node.prefetch_expansions(expand_state, words)
+                return [node.expand_concept(expand_state, word) for word in words]
+            bench(f"expand_concept/{engine}", expand, items=len(words))
+
+    dictionaries_module = sys.modules[f"{PACKAGE_NAME}.flux_dictionaries"]
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "shop.tsv"), "w", encoding="utf-8") as f:
+            for i in range(DICTIONARY_ENTRIES):
+                f.write(f"negative{i}\tpositive{i}\n" if i % 10 else f"negative phrase {i}\tpositive phrase {i}\n")
+        cache_dir = os.path.join(directory, "cache")
+
+        def load_dictionary():
+            return dictionaries_module.DictionaryStore(directory, cache_dir).load("blurry:sharp").phrase_handler
+        bench("custom_dictionary/compile", load_dictionary,
+              setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True), items=DICTIONARY_ENTRIES)
+        bench("custom_dictionary/load", load_dictionary, items=DICTIONARY_ENTRIES)
+
+    batch = [(prompt["positive"], prompt["negative"]) for prompt in corpus]
+    bench("run_batch/basic/corpus/cold",
+          lambda: node.run_batch(batch, 0.5, "basic", "default", fill_mask_backend=fill_mask_backend),
+          setup=clear_caches, items=len(batch))
+
+    server.shutdown()
+    return results, agreement
+
+
+def edited_negative(negative):
+    """`negative` with its middle tag replaced by INCREMENTAL_EDIT."""
+    tags = negative.split(",")
+    tags[len(tags) // 2] = f" {INCREMENTAL_EDIT}" if len(tags) > 1 else INCREMENTAL_EDIT
+    return ",".join(tags)
+
+
+def baseline_differences(results, baseline):
+    """Settings that differ between this run and the baseline, which make its timings incomparable."""
+    return [f"{key} {baseline.get(key)!r} -> {results[key]!r}"
+            for key in ("python", "machine", "fill_mask_model", "fill_mask_backend", "repeat")
+            if baseline.get(key) != results[key]]
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous and previous["p50_ms"] > 0:
+            ratio = current["p50_ms"] / previous["p50_ms"]
+            if ratio > 1 + tolerance:
+                regressions.append(f"{name}: p50 {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms "
+                                   f"({(ratio - 1) * 100:+.0f}%)")
+    previous_import = baseline.get("import_ms")
+    if previous_import and results["import_ms"] > previous_import * (1 + tolerance):
+        regressions.append(f"import time {previous_import:.1f} -> {results['import_ms']:.1f} ms")
+    previous_rss = baseline.get("peak_rss_mb")
+    if previous_rss and results["peak_rss_mb"] > previous_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {previous_rss:.1f} -> {results['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FluxPseudoNegative conversion pipeline")
+    parser.add_argument("--repeat", type=int, default=20, help="timed iterations per benchmark")
+    parser.add_argument("--fill-mask-model", default=TINY_FILL_MASK_MODEL,
+                        help="fill-mask model name or local path (default: a tiny random BERT)")
+    parser.add_argument("--fill-mask-backend", default="transformers", choices=["transformers", "onnx", "onnx-int8"],
+                        help="fill-mask backend to benchmark; ONNX backends also report agreement with transformers")
+    parser.add_argument("--only", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--output", help="write the results JSON to this path")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="exit with status 1 if results regress")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 25%%)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    import_ms = measure_import_ms()
+    print(f"{'import':48s} {import_ms:9.3f} ms")
+    benchmarks, agreement = run_benchmarks(
+        args.repeat, args.fill_mask_model, args.only, args.fill_mask_backend)
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "fill_mask_model": args.fill_mask_model,
+        "fill_mask_backend": args.fill_mask_backend,
+        "fill_mask_agreement": agreement,
+        "import_ms": round(import_ms, 3),
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (2**20 if sys.platform == "darwin" else 2**10), 1),
+        "benchmarks": benchmarks,
+    }
+    print(f"{'peak RSS':48s} {results['peak_rss_mb']:9.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for difference in baseline_differences(results, baseline):
+            print(f"Warning: baseline was recorded with {difference}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# flux_builtins.py
+#
+# The built-in phrase map and strength map. Both are edited as TSV files, data/phrase_map.tsv
+# and data/strength_map.tsv, which are validated (a duplicate or malformed entry is an error)
+# and compiled by install.py into memory-mapped string tables next to them. Every process maps
+# the same page-cached copy, so creating a node or a PhraseHandler builds no tables. The node
+# never compiles them itself: a missing or stale table is read from its TSV instead. Recompile
+# both with
+#
+#     python flux_builtins.py
+import logging
+import os
+import threading
+from collections.abc import Mapping
+
+try:
+    from .flux_tables import StringTable, build_table
+except ImportError:  # run as a script
+    from flux_tables import StringTable, build_table
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+PHRASE_MAP_PATH = os.path.join(_DATA_DIR, "phrase_map.tsv")
+STRENGTH_MAP_PATH = os.path.join(_DATA_DIR, "strength_map.tsv")
+
+
+def parse_strength(value):
+    strength = float(value)
+    if not 0.0 <= strength <= 1.0:
+        raise ValueError(f"strength {strength} is outside [0, 1]")
+    return strength
+
+
+def read_table_source(path, parse=str):
+    """Read "key<TAB>value" lines into a dict, raising ValueError on duplicate keys or malformed lines."""
+    entries = {}
+    first_lines = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.split("\t")]
+            if len(fields) != 2 or not all(fields):
+                raise ValueError(f"{path}:{number}: expected 'key<TAB>value', got {line!r}")
+            key, value = fields
+            if key in entries:
+                raise ValueError(f"{path}:{number}: duplicate key {key!r}, already defined on line {first_lines[key]}")
+            try:
+                entries[key] = parse(value)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: invalid value for {key!r}: {e}") from None
+            first_lines[key] = number
+    return entries
+
+
+def compile_table(source, path, parse=str):
+    """Validate the TSV `source` and write it to the string table `path`."""
+    entries = read_table_source(source, parse)
+    build_table(path, {key: (value,) for key, value in entries.items()}, 1)
+    logger.info("Built-in table written to %s (%s entries)", path, len(entries))
+    return path
+
+
+class BuiltinTable(Mapping):
+    """Read-only mapping over a built-in table, opened on first use.
+
+    install.py compiles the table. If the compiled file is missing or older than its TSV, the
+    TSV is parsed into memory instead, so a run never writes to the data directory.
+    """
+
+    def __init__(self, source, parse=str, convert=str):
+        self.source = source
+        self.path = os.path.splitext(source)[0] + ".fpnt"
+        self.parse = parse
+        self.convert = convert
+        self._table = None
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        """Whether the compiled table is missing or older than its TSV."""
+        return not os.path.exists(self.path) or os.path.getmtime(self.path) < os.path.getmtime(self.source)
+
+    def compile(self):
+        """Validate the TSV and write the compiled table; returns its path."""
+        return compile_table(self.source, self.path, self.parse)
+
+    @property
+    def table(self):
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    if self.is_stale():
+                        logger.warning("%s is missing or older than %s, reading the TSV instead. "
+                                       "Run `python install.py` to compile it.", self.path, self.source)
+                        entries = read_table_source(self.source, self.parse)
+                        self._table = {key: (value,) for key, value in entries.items()}
+                    else:
+                        self._table = StringTable(self.path)
+        return self._table
+
+    def get(self, key, default=None):
+        fields = self.table.get(key) if isinstance(key, str) else None
+        return default if fields is None else self.convert(fields[0])
+
+    def __getitem__(self, key):
+        fields = self.table.get(key) if isinstance(key, str) else None
+        if fields is None:
+            raise KeyError(key)
+        return self.convert(fields[0])
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.table.get(key) is not None
+
+    def __iter__(self):
+        return (key for key, _ in self.table.items())
+
+    def __len__(self):
+        return len(self.table)
+
+
+phrase_map = BuiltinTable(PHRASE_MAP_PATH)
+strength_map = BuiltinTable(STRENGTH_MAP_PATH, parse_strength, float)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    phrase_map.compile()
+    strength_map.compile()
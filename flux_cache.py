@@ -0,0 +1,126 @@
+# flux_cache.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 8192
+DEFAULT_RESULT_CACHE_SIZE = 1024
+CACHE_PATH_ENV = "FLUX_ANTONYM_CACHE_DB"
+_KEY_SEPARATOR = "\x1f"
+
+
+def fingerprint(mapping):
+    """Stable fingerprint of a dict, used to tie cache entries to the custom antonyms they were built with."""
+    if not mapping:
+        return ""
+    digest = hashlib.sha1()
+    for key, value in sorted(mapping.items()):
+        digest.update(f"{key}{_KEY_SEPARATOR}{value}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AntonymCache:
+    """Size-bounded LRU cache for antonym lookups, optionally backed by a SQLite file.
+
+    Keys are tuples of strings, e.g. ("word", "blurry", strategy_chain, custom_fingerprint).
+    With a `path`, values must be tuples of strings too, e.g. ("sharp", "wordnet"); the most
+    recent entries are warm-loaded at construction and new entries are written back on `flush()`.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.Lock()
+        if path:
+            self._warm_load()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._dirty[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE IF NOT EXISTS antonyms "
+                           "(key TEXT PRIMARY KEY, value TEXT NOT NULL, seq INTEGER NOT NULL)")
+        return connection
+
+    def _warm_load(self):
+        try:
+            with self._connect() as connection:
+                rows = connection.execute("SELECT key, value FROM antonyms ORDER BY seq DESC LIMIT ?",
+                                          (self.max_size,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Could not load antonym cache from %s: %s", self.path, e)
+            return
+        for key, value in reversed(rows):
+            self._entries[tuple(key.split(_KEY_SEPARATOR))] = tuple(value.split(_KEY_SEPARATOR))
+        logger.info("Antonym cache warm-loaded %s entries from %s", len(rows), self.path)
+
+    def flush(self):
+        """Write entries added since the last flush to the SQLite store."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+        try:
+            with self._connect() as connection:
+                start = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM antonyms").fetchone()[0]
+                connection.executemany(
+                    "INSERT OR REPLACE INTO antonyms (key, value, seq) VALUES (?, ?, ?)",
+                    [(_KEY_SEPARATOR.join(key), _KEY_SEPARATOR.join(value), start + i + 1)
+                     for i, (key, value) in enumerate(dirty.items())])
+        except sqlite3.Error as e:
+            logger.warning("Could not persist antonym cache to %s: %s", self.path, e)
+            return 0
+        return len(dirty)
+
+
+antonym_cache = AntonymCache(path=os.environ.get(CACHE_PATH_ENV) or None)
+# Whole conversions, keyed on a hash of the node inputs and data versions; memory only
+result_cache = AntonymCache(max_size=DEFAULT_RESULT_CACHE_SIZE)
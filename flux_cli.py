@@ -0,0 +1,191 @@
+# flux_cli.py
+#
+# Command line front end for converting prompt datasets without ComfyUI.
+#
+#     python flux_cli.py convert prompts.jsonl > converted.jsonl
+#     cat prompts.jsonl | python flux_cli.py convert --complexity expert --processes 4
+#     python flux_cli.py serve --port 8765            # the flux_server.py HTTP service
+#
+# Each input line is a JSON object with a "negative_prompt", an optional "positive_prompt" and
+# optionally any node option ("strength", "complexity", "custom_antonyms", ...), which override
+# the command line. It is written back with "modified_prompt" and "llm_input" added, in input
+# order. Chunks of lines are converted in parallel by worker processes, each with its own engine.
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import deque
+from itertools import islice
+
+if __package__:
+    from .flux_engine import FluxPseudoNegativeEngine, RUN_OPTIONS
+    from .flux_models import (DEFAULT_FILL_MASK_MODEL, DEFAULT_DEVICE, FILL_MASK_BACKENDS, FILL_MASK_VOCABULARIES)
+    from .flux_embeddings import EXPANSION_ENGINES
+else:  # run as a script: import this directory as a package so its relative imports resolve
+    import importlib.util
+
+    _HERE = os.path.dirname(os.path.abspath(__file__))
+    if "flux_pseudo_negative" not in sys.modules:
+        _spec = importlib.util.spec_from_file_location("flux_pseudo_negative", os.path.join(_HERE, "__init__.py"),
+                                                       submodule_search_locations=[_HERE])
+        sys.modules["flux_pseudo_negative"] = importlib.util.module_from_spec(_spec)
+        _spec.loader.exec_module(sys.modules["flux_pseudo_negative"])
+    from flux_pseudo_negative.flux_engine import FluxPseudoNegativeEngine, RUN_OPTIONS
+    from flux_pseudo_negative.flux_models import (DEFAULT_FILL_MASK_MODEL, DEFAULT_DEVICE, FILL_MASK_BACKENDS,
+                                                  FILL_MASK_VOCABULARIES)
+    from flux_pseudo_negative.flux_embeddings import EXPANSION_ENGINES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64  # records per task sent to a worker process
+
+_engine = None
+_defaults = {}
+
+
+def _init_worker(fill_mask_model, fill_mask_device, defaults):
+    global _engine, _defaults
+    # One torch thread per process; the processes already use every core
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    _engine = FluxPseudoNegativeEngine(fill_mask_model, fill_mask_device)
+    _defaults = defaults
+
+
+def _convert_chunk(records):
+    return _engine.convert_records(records, **_defaults)
+
+
+def read_records(paths):
+    """Yield the JSON object on each non-blank line of `paths` ("-" for stdin)."""
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: {e}") from None
+                if not isinstance(record, dict) or not isinstance(record.get("negative_prompt"), str):
+                    raise ValueError(f"{path}:{number}: expected an object with a string negative_prompt")
+                yield record
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_stream(records, output, processes=1, chunk_size=DEFAULT_CHUNK_SIZE, fill_mask_model=DEFAULT_FILL_MASK_MODEL,
+                   fill_mask_device=DEFAULT_DEVICE, **defaults):
+    """Convert `records` and write them to `output` as JSONL, in order; returns the number written."""
+    written = 0
+
+    def write(chunk, outputs):
+        nonlocal written
+        for record, (result, llm_input) in zip(chunk, outputs):
+            output.write(json.dumps({**record, "modified_prompt": result, "llm_input": llm_input},
+                                    ensure_ascii=False) + "\n")
+        written += len(chunk)
+
+    if processes <= 1:
+        engine = FluxPseudoNegativeEngine(fill_mask_model, fill_mask_device)
+        for chunk in chunks(records, chunk_size):
+            write(chunk, engine.convert_records(chunk, **defaults))
+        return written
+
+    import multiprocessing
+
+    with multiprocessing.Pool(processes, _init_worker, (fill_mask_model, fill_mask_device, defaults)) as pool:
+        # A bounded number of chunks in flight keeps memory flat on large inputs
+        pending = deque()
+        for chunk in chunks(records, chunk_size):
+            pending.append((chunk, pool.apply_async(_convert_chunk, (chunk,))))
+            if len(pending) >= 2 * processes:
+                chunk, result = pending.popleft()
+                write(chunk, result.get())
+        while pending:
+            chunk, result = pending.popleft()
+            write(chunk, result.get())
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert negative prompts without ComfyUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert JSONL prompts from files or stdin to stdout")
+    convert.add_argument("inputs", nargs="*", default=["-"], help="JSONL files (default: stdin)")
+    convert.add_argument("-o", "--output", help="write to this file instead of stdout")
+    convert.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                         help="worker processes, each loading its own models (default: one per core)")
+    convert.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="records per worker task")
+
+    serve = commands.add_parser("serve", help="run the local HTTP conversion service")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--preload", action="store_true", help="load the fill-mask model before serving")
+
+    for command in (convert, serve):
+        command.add_argument("--fill-mask-model", default=DEFAULT_FILL_MASK_MODEL)
+        command.add_argument("--fill-mask-device", type=int, default=DEFAULT_DEVICE, help="-1 for CPU, else a GPU index")
+        command.add_argument("--strength", type=float, default=RUN_OPTIONS["strength"])
+        command.add_argument("--complexity", choices=["basic", "advanced", "expert"],
+                             default=RUN_OPTIONS["complexity"])
+        command.add_argument("--system-prompt-choice", choices=["default", "prompt_1", "prompt_2"],
+                             default=RUN_OPTIONS["system_prompt_choice"])
+        command.add_argument("--custom-antonyms", metavar="FILE", help="file of negative:positive lines")
+        command.add_argument("--custom-system-prompt", metavar="FILE", help="file with a custom LLM system prompt")
+        command.add_argument("--use-conceptnet", action="store_true")
+        command.add_argument("--use-llm-full", action="store_true")
+        command.add_argument("--use-llm-fallback", action="store_true")
+        command.add_argument("--fill-mask-batch-size", type=int, default=RUN_OPTIONS["fill_mask_batch_size"])
+        command.add_argument("--fill-mask-backend", choices=FILL_MASK_BACKENDS, default=RUN_OPTIONS["fill_mask_backend"])
+        command.add_argument("--fill-mask-vocabulary", choices=FILL_MASK_VOCABULARIES,
+                             default=RUN_OPTIONS["fill_mask_vocabulary"])
+        command.add_argument("--expansion-engine", choices=EXPANSION_ENGINES, default=RUN_OPTIONS["expansion_engine"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    defaults = {name: getattr(args, name) for name in RUN_OPTIONS}
+    for name in ("custom_antonyms", "custom_system_prompt"):
+        if defaults[name] is not None:
+            with open(defaults[name], encoding="utf-8") as f:
+                defaults[name] = f.read()
+
+    if args.command == "serve":
+        if __package__:
+            from .flux_server import serve
+        else:
+            from flux_pseudo_negative.flux_server import serve
+        logging.getLogger(serve.__module__).setLevel(logging.INFO)
+        engine = FluxPseudoNegativeEngine(args.fill_mask_model, args.fill_mask_device)
+        if args.preload:
+            engine.conversion_state(fill_mask_backend=args.fill_mask_backend).transformer_model
+        serve(engine, args.host, args.port, defaults)
+        return 0
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        count = convert_stream(read_records(args.inputs), output, args.processes, args.chunk_size,
+                               args.fill_mask_model, args.fill_mask_device, **defaults)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logger.info("Converted %s prompts", count)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# flux_conceptnet.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+try:
+    from .flux_metrics import metrics
+except ImportError:  # run as a script
+    from flux_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "http://api.conceptnet.io"
+CONCEPTNET_DB_ENV = "FLUX_CONCEPTNET_DB"
+CONCEPTNET_URL_ENV = "FLUX_CONCEPTNET_URL"
+
+
+def concept_key(word):
+    """ConceptNet node name for an English term: lowercase with underscores."""
+    return word.strip().lower().replace(" ", "_")
+
+
+def concept_label(uri):
+    """Human readable label of a /c/en/<term>[/pos/...] URI."""
+    return uri.split("/")[3].replace("_", " ")
+
+
+class ConceptNetBackend:
+    """Looks up ConceptNet Antonym edges. Subclasses implement `antonyms`."""
+
+    def antonyms(self, word, limit=3):
+        raise NotImplementedError
+
+    def antonyms_many(self, words, limit=3):
+        """Return {word: [related labels]} for every distinct word."""
+        return {word: self.antonyms(word, limit) for word in dict.fromkeys(words)}
+
+    def clear_cache(self):
+        """Forget cached responses; backends without a cache do nothing."""
+
+
+class HttpConceptNetBackend(ConceptNetBackend):
+    """Pooled, concurrent client for the ConceptNet REST API with a TTL response cache."""
+
+    def __init__(self, base_url=DEFAULT_API_URL, max_workers=8, timeout=5.0, retries=2,
+                 cache_ttl=3600.0, cache_size=4096):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.errors = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers,
+                              max_retries=Retry(total=retries, backoff_factor=0.2,
+                                                status_forcelist=(429, 500, 502, 503, 504)))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conceptnet")
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, related = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return related
+
+    def _store(self, key, related):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, related)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _fetch(self, key):
+        with metrics.timed("flux_network_request_seconds", service="conceptnet"):
+            response = self.session.get(f"{self.base_url}/c/en/{quote(key)}", timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        return [edge['end']['label'] for edge in data.get('edges', []) if edge['rel']['label'] == 'Antonym']
+
+    def antonyms(self, word, limit=3):
+        key = concept_key(word)
+        related = self._cached(key)
+        metrics.inc("flux_conceptnet_cache_total", result="miss" if related is None else "hit")
+        if related is None:
+            logger.debug("Querying ConceptNet for word: %s", word)
+            try:
+                related = self._fetch(key)
+            except Exception as e:
+                logger.warning("ConceptNet request for %s failed: %s", word, e)
+                with self._lock:
+                    self.errors += 1
+                return []
+            self._store(key, related)
+        return related[:limit]
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def antonyms_many(self, words, limit=3):
+        words = list(dict.fromkeys(words))
+        results = self._executor.map(lambda word: self.antonyms(word, limit), words)
+        return dict(zip(words, results))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class LocalConceptNetBackend(ConceptNetBackend):
+    """Offline backend reading Antonym edges from a SQLite index built by `build_conceptnet_index`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+    def antonyms(self, word, limit=3):
+        with metrics.timed("flux_conceptnet_local_seconds"):
+            rows = self._connection.execute(
+                "SELECT related FROM antonyms WHERE word = ? ORDER BY weight DESC, related LIMIT ?",
+                (concept_key(word), limit)).fetchall()
+        return [related for (related,) in rows]
+
+
+def build_conceptnet_index(assertions_path, db_path):
+    """Convert a ConceptNet assertions dump (conceptnet-assertions-5.x.csv[.gz]) into a SQLite Antonym index."""
+    import gzip
+
+    opener = gzip.open if assertions_path.endswith(".gz") else open
+    rows = []
+    with opener(assertions_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            # Tab separated without quoting; the last column is JSON metadata
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5 or fields[1] != "/r/Antonym":
+                continue
+            start, end = fields[2], fields[3]
+            if not (start.startswith("/c/en/") and end.startswith("/c/en/")):
+                continue
+            weight = json.loads(fields[4]).get("weight", 1.0)
+            # Antonymy is symmetric, so index the edge from both ends
+            rows.append((start.split("/")[3], concept_label(end), weight))
+            rows.append((end.split("/")[3], concept_label(start), weight))
+
+    tmp_path = f"{db_path}.tmp{os.getpid()}"
+    with sqlite3.connect(tmp_path) as connection:
+        connection.execute("DROP TABLE IF EXISTS antonyms")
+        connection.execute("CREATE TABLE antonyms (word TEXT NOT NULL, related TEXT NOT NULL, weight REAL NOT NULL)")
+        connection.executemany("INSERT INTO antonyms VALUES (?, ?, ?)", rows)
+        connection.execute("CREATE INDEX antonyms_word ON antonyms (word, weight DESC)")
+    os.replace(tmp_path, db_path)
+    logger.info("ConceptNet antonym index written to %s (%s edges)", db_path, len(rows))
+    return db_path
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+
+
+def get_conceptnet_backend():
+    """Shared backend: the local index when FLUX_CONCEPTNET_DB points to one, the HTTP API otherwise.
+
+    The API is reached at FLUX_CONCEPTNET_URL, or api.conceptnet.io when that is not set.
+    """
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            db_path = os.environ.get(CONCEPTNET_DB_ENV)
+            if db_path and os.path.exists(db_path):
+                _default_backend = LocalConceptNetBackend(db_path)
+            else:
+                _default_backend = HttpConceptNetBackend(os.environ.get(CONCEPTNET_URL_ENV) or DEFAULT_API_URL)
+        return _default_backend
+
+
+def set_conceptnet_backend(backend):
+    """Use `backend` for every ConceptNet lookup (None restores the default); returns the previous backend."""
+    global _default_backend
+    with _default_lock:
+        previous, _default_backend = _default_backend, backend
+        return previous
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) != 3:
+        sys.exit("usage: python flux_conceptnet.py <conceptnet-assertions.csv[.gz]> <output.sqlite>")
+    build_conceptnet_index(sys.argv[1], sys.argv[2])
@@ -0,0 +1,247 @@
+# flux_dictionaries.py
+#
+# User antonym dictionaries: the node's inline `custom_antonyms` text plus JSON, CSV and TSV
+# files in a dictionary directory (data/dictionaries/, or FLUX_DICTIONARY_DIR). Single words are
+# answered by the custom_dict strategy and multi-word entries are matched by a PhraseHandler,
+# like the built-in phrase map. Directory files are compiled into memory-mapped string tables
+# in the user cache directory (see flux_utils.user_cache_dir) and only recompiled when a file's
+# name, size or mtime changes. When the cache cannot be written, they are kept in memory.
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from .flux_cache import fingerprint
+from .flux_tables import StringTable, build_table
+from .flux_utils import PhraseHandler, phrase_tokens, user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_DICTIONARY_DIR = os.path.join(_DATA_DIR, "dictionaries")
+DICTIONARY_DIR_ENV = "FLUX_DICTIONARY_DIR"
+DICTIONARY_EXTENSIONS = (".json", ".csv", ".tsv")
+_COMPILED_CACHE_SIZE = 16
+
+
+def parse_antonym_lines(text, source="custom_antonyms"):
+    """Parse "negative:positive" lines into a dict. Only the first colon separates the pair.
+
+    Blank lines and lines starting with "#" are skipped; lines without a pair are logged and skipped.
+    """
+    entries = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negative, separator, positive = line.partition(":")
+        negative, positive = negative.strip(), positive.strip()
+        if not separator or not negative or not positive:
+            logger.warning("Ignoring %s line %s, expected 'negative:positive': %r", source, number, line)
+            continue
+        entries[negative] = positive
+    return entries
+
+
+def read_dictionary_file(path):
+    """Read a JSON object or a two-column CSV/TSV file of negative -> positive entries."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{path} must contain a JSON object of negative: positive entries")
+            rows = data.items()
+        else:
+            rows = csv.reader(f, delimiter="\t" if path.endswith(".tsv") else ",")
+            rows = [row[:2] for row in rows if len(row) >= 2 and not row[0].lstrip().startswith("#")]
+        entries = {}
+        for negative, positive in rows:
+            negative, positive = str(negative).strip(), str(positive).strip()
+            if negative and positive:
+                entries[negative] = positive
+        return entries
+
+
+def split_entries(entries):
+    """Split entries into (single words, multi-word phrases), tokenised like prompts."""
+    words, phrases = {}, {}
+    for negative, positive in entries.items():
+        (words if len(phrase_tokens(negative)) == 1 else phrases)[negative] = positive
+    return words, phrases
+
+
+def directory_signature(directory):
+    """Hash of the name, size and mtime of every dictionary file in `directory`; "" if there are none."""
+    try:
+        files = sorted((entry for entry in os.scandir(directory)
+                        if entry.is_file() and entry.name.endswith(DICTIONARY_EXTENSIONS)), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return "", []
+    if not files:
+        return "", []
+    digest = hashlib.sha1()
+    for entry in files:
+        stat = entry.stat()
+        digest.update(f"{entry.name}\x1f{stat.st_size}\x1f{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest(), [entry.path for entry in files]
+
+
+class DirectoryDictionary:
+    """Compiled entries of a dictionary directory: a string table of words plus the phrase entries.
+
+    `words` maps each word to its fields, `(positive,)`; it is a dict when the table could not be written.
+    """
+
+    def __init__(self, signature, words, phrases):
+        self.signature = signature
+        self.words = words
+        self.phrases = phrases
+        self._phrase_handler = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.words) + len(self.phrases)
+
+    @property
+    def phrase_handler(self):
+        """A PhraseHandler over the built-in and directory phrases, built once per signature; None without phrases."""
+        if self._phrase_handler is None and self.phrases:
+            with self._lock:
+                if self._phrase_handler is None:
+                    self._phrase_handler = PhraseHandler(extra_phrases=self.phrases)
+        return self._phrase_handler
+
+    @classmethod
+    def load(cls, directory, signature, paths, cache_dir=None):
+        cache_dir = cache_dir or user_cache_dir("dictionaries")
+        prefix = os.path.join(cache_dir, hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()[:16])
+        words_path, phrases_path, meta_path = f"{prefix}.words.fpnt", f"{prefix}.phrases.fpnt", f"{prefix}.json"
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                compiled_signature = json.load(f)["signature"]
+        except (OSError, ValueError, KeyError):
+            compiled_signature = None
+        if compiled_signature != signature:
+            logger.info("Compiling %s custom dictionary files from %s...", len(paths), directory)
+            entries = {}
+            for path in paths:
+                try:
+                    entries.update(read_dictionary_file(path))
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping custom dictionary %s: %s", path, e)
+            words, phrases = split_entries({negative: positive for negative, positive in entries.items()
+                                            if "\x1f" not in negative + positive})
+            word_fields = {word: (positive,) for word, positive in words.items()}
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                build_table(words_path, word_fields, 1)
+                build_table(phrases_path, {phrase: (positive,) for phrase, positive in phrases.items()}, 1)
+                tmp_path = f"{meta_path}.tmp{os.getpid()}"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"signature": signature, "directory": os.path.abspath(directory)}, f)
+                os.replace(tmp_path, meta_path)
+            except OSError as e:
+                # A read-only cache only costs the compile on each change; the entries are the same
+                logger.warning("Could not write the compiled custom dictionary to %s, keeping it in memory: %s",
+                               cache_dir, e)
+                return cls(signature, word_fields, phrases)
+            logger.info("Custom dictionary compiled: %s words, %s phrases", len(words), len(phrases))
+        phrase_table = StringTable(phrases_path)
+        phrases = {phrase: fields[0] for phrase, fields in phrase_table.items()}
+        phrase_table.close()
+        return cls(signature, StringTable(words_path), phrases)
+
+
+class CustomDictionary:
+    """Inline entries layered over a directory dictionary; inline entries win."""
+
+    def __init__(self, inline=None, directory=None):
+        self.words, self.phrases = split_entries(inline or {})
+        self.directory = directory
+        self._phrase_handler = None
+        self._lock = threading.Lock()
+        if directory is None:
+            self.fingerprint = fingerprint(inline)
+        else:
+            self.fingerprint = hashlib.sha1(f"{directory.signature}\x1f{fingerprint(inline)}".encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self.words) + len(self.phrases) + (len(self.directory) if self.directory is not None else 0)
+
+    def has_phrase(self, phrase):
+        """Whether `phrase` is a custom phrase rather than only a built-in one."""
+        return phrase in self.phrases or (self.directory is not None and phrase in self.directory.phrases)
+
+    def get(self, word, default=None):
+        if word in self.words:
+            return self.words[word]
+        if self.directory is not None:
+            fields = self.directory.words.get(word)
+            if fields is not None:
+                return fields[0]
+        return default
+
+    @property
+    def phrase_handler(self):
+        """A PhraseHandler over the built-in and custom phrases, or None without custom phrases.
+
+        The inline phrases are layered over the directory's shared handler, so neither the
+        built-in nor the directory phrases are copied for each distinct inline text.
+        """
+        base = self.directory.phrase_handler if self.directory is not None else None
+        if not self.phrases:
+            return base
+        if self._phrase_handler is None:
+            with self._lock:
+                if self._phrase_handler is None:
+                    self._phrase_handler = PhraseHandler(extra_phrases=self.phrases, base=base)
+        return self._phrase_handler
+
+
+class DictionaryStore:
+    """Compiles custom dictionaries on demand, reusing them until the inline text or a file changes.
+
+    Compiled directories go to `cache_dir`, or to the user cache directory when it is None.
+    """
+
+    def __init__(self, directory=None, cache_dir=None, cache_size=_COMPILED_CACHE_SIZE):
+        self.directory = directory or os.environ.get(DICTIONARY_DIR_ENV) or DEFAULT_DICTIONARY_DIR
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self._directory_dictionary = None
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_directory(self):
+        signature, paths = directory_signature(self.directory)
+        if not signature:
+            return None
+        current = self._directory_dictionary
+        if current is None or current.signature != signature:
+            current = self._directory_dictionary = DirectoryDictionary.load(self.directory, signature, paths,
+                                                                            self.cache_dir)
+        return current
+
+    def signature(self):
+        """Signature of the dictionary directory's current files, "" when it has none."""
+        return directory_signature(self.directory)[0]
+
+    def load(self, text=""):
+        """Return the `CustomDictionary` for the inline `text` and the current directory contents."""
+        with self._lock:
+            directory = self._load_directory()
+            key = (hashlib.sha1((text or "").encode("utf-8")).hexdigest(),
+                   directory.signature if directory is not None else "")
+            dictionary = self._compiled.get(key)
+            if dictionary is None:
+                dictionary = self._compiled[key] = CustomDictionary(parse_antonym_lines(text or ""), directory)
+                while len(self._compiled) > self.cache_size:
+                    self._compiled.popitem(last=False)
+            self._compiled.move_to_end(key)
+            return dictionary
+
+
+custom_dictionaries = DictionaryStore()
@@ -0,0 +1,240 @@
+# flux_embeddings.py
+#
+# Embedding-based concept expansion. Every positive target the node can produce (phrase_map
+# replacements, the milder half of strength_map and all WordNet antonyms) is embedded once with
+# the fill-mask model's encoder and stored as a unit-normalised float32 matrix under
+# data/embeddings/. Expanding a prompt's antonyms is then one batched encode and one matrix
+# product against the memory-mapped matrix, instead of a fill-mask query per word.
+#
+# install.py builds the matrix for the default model; for another model run
+#
+#     python flux_embeddings.py [model]
+#
+# The node never builds it at run time.
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    from .flux_cache import fingerprint
+    from .flux_metrics import metrics
+    from .flux_models import fill_mask_registry, DEFAULT_FILL_MASK_MODEL, DEFAULT_DEVICE, DEFAULT_BATCH_SIZE
+except ImportError:  # run as a script
+    from flux_cache import fingerprint
+    from flux_metrics import metrics
+    from flux_models import fill_mask_registry, DEFAULT_FILL_MASK_MODEL, DEFAULT_DEVICE, DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+EXPANSION_ENGINES = ["fill_mask", "embeddings"]
+EMBEDDING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "embeddings")
+DEFAULT_QUERY_CACHE_SIZE = 4096
+EMBEDDING_ANN_ENV = "FLUX_EMBEDDING_ANN"
+# strength_map rates how negative a descriptor is; only the milder half are useful expansions
+MAX_TARGET_STRENGTH = 0.5
+
+
+def expansion_targets():
+    """Every concept an antonym may be expanded to, in a stable order."""
+    try:
+        from .flux_utils import PhraseHandler, strength_map
+        from .flux_wordnet import wordnet_index
+    except ImportError:  # run as a script
+        from flux_utils import PhraseHandler, strength_map
+        from flux_wordnet import wordnet_index
+
+    targets = dict.fromkeys(PhraseHandler().phrase_map.values())
+    targets.update(dict.fromkeys(word for word, strength in strength_map.items() if strength < MAX_TARGET_STRENGTH))
+    for _, fields in wordnet_index.table.items():
+        # The last field lists every antonym as "name:count"
+        targets.update(dict.fromkeys(item.rsplit(":", 1)[0].replace("_", " ") for item in fields[2].split(",")))
+    return list(targets)
+
+
+def embedding_paths(directory, model):
+    """(matrix, labels) paths of `model`'s target embeddings in `directory`."""
+    prefix = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "--", model))
+    return f"{prefix}.npy", f"{prefix}.json"
+
+
+class EmbeddingIndex:
+    """Unit-normalised target embeddings in a memory-mapped .npy matrix, searched with one matrix product."""
+
+    def __init__(self, matrix_path, labels, use_ann=False):
+        import numpy as np
+
+        self.matrix = np.load(matrix_path, mmap_mode="r")
+        self.labels = labels
+        self._ann = self._build_ann() if use_ann else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _build_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            logger.warning("faiss is not installed; using exact search")
+            return None
+        import numpy as np
+
+        ann = faiss.IndexHNSWFlat(self.matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        ann.add(np.ascontiguousarray(self.matrix))
+        return ann
+
+    def search(self, queries, top_n):
+        """Return (indices, scores) of the `top_n` most similar targets for each row of `queries`."""
+        import numpy as np
+
+        top_n = min(top_n, len(self.labels))
+        if self._ann is not None:
+            scores, indices = self._ann.search(np.ascontiguousarray(queries, dtype=np.float32), top_n)
+            return indices, scores
+        scores = queries @ self.matrix.T
+        top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+        indices = np.take_along_axis(top, order, axis=1)
+        return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+class EmbeddingEngine:
+    """Expands concepts to their nearest expansion targets in the encoder's embedding space."""
+
+    def __init__(self, model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE, directory=EMBEDDING_DIR,
+                 use_ann=False, cache_size=DEFAULT_QUERY_CACHE_SIZE):
+        self.model = model
+        self.device = device
+        self.directory = directory
+        self.use_ann = use_ann
+        self.cache_size = cache_size
+        self._index = None
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    @property
+    def pipe(self):
+        # The encoder of the transformers fill-mask pipeline, shared with the fill-mask strategies
+        return fill_mask_registry.get(self.model, self.device, "transformers")
+
+    def _encode(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        import numpy as np
+        import torch
+
+        pipe = self.pipe
+        encoder = pipe.model.base_model
+        chunks = []
+        with torch.no_grad():
+            for start in range(0, len(texts), batch_size):
+                encoded = pipe.tokenizer(texts[start:start + batch_size], padding=True,
+                                         return_tensors="pt").to(encoder.device)
+                hidden = encoder(**encoded).last_hidden_state
+                mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(1) / mask.sum(1)
+                chunks.append(torch.nn.functional.normalize(pooled, dim=1).float().cpu().numpy())
+        return np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+    def encode(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        """Unit-normalised mean-pooled embeddings of `texts`, reusing cached query embeddings."""
+        import numpy as np
+
+        texts = list(texts)
+        with self._lock:
+            vectors = {text: self._queries[text] for text in dict.fromkeys(texts) if text in self._queries}
+            for text in vectors:
+                self._queries.move_to_end(text)
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        metrics.inc("flux_embedding_query_cache_total", len(vectors), result="hit")
+        metrics.inc("flux_embedding_query_cache_total", len(missing), result="miss")
+        if missing:
+            with metrics.timed("flux_embedding_seconds", op="encode"):
+                vectors.update(zip(missing, self._encode(missing, batch_size)))
+            with self._lock:
+                for text in missing:
+                    self._queries[text] = vectors[text]
+                while len(self._queries) > self.cache_size:
+                    self._queries.popitem(last=False)
+        return np.stack([vectors[text] for text in texts])
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        matrix_path, labels_path = embedding_paths(self.directory, self.model)
+        if not (os.path.exists(matrix_path) and os.path.exists(labels_path)):
+            raise LookupError(f"Embedding index {matrix_path} is missing. Run `python install.py` in the "
+                              f"FluxPseudoNegative node directory, or `python flux_embeddings.py {self.model}`.")
+        with open(labels_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["fingerprint"] != fingerprint(dict.fromkeys(expansion_targets(), "")):
+            logger.warning("The expansion targets changed since the embedding index %s was built; "
+                           "run `python flux_embeddings.py %s` to include them", matrix_path, self.model)
+        return EmbeddingIndex(matrix_path, meta["labels"], self.use_ann)
+
+    def build_index(self, targets=None):
+        """Embed `targets` (every expansion target by default) and write the index files; returns the matrix path."""
+        import numpy as np
+
+        targets = expansion_targets() if targets is None else list(targets)
+        matrix_path, labels_path = embedding_paths(self.directory, self.model)
+        logger.info("Embedding %s expansion targets with %s...", len(targets), self.model)
+        with metrics.timed("flux_embedding_seconds", op="build"):
+            matrix = self._encode(targets).astype(np.float32)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_matrix, tmp_labels = f"{matrix_path}.tmp{os.getpid()}.npy", f"{labels_path}.tmp{os.getpid()}"
+        np.save(tmp_matrix, matrix)
+        with open(tmp_labels, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint(dict.fromkeys(targets, "")), "labels": targets}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_matrix, matrix_path)
+        os.replace(tmp_labels, labels_path)
+        with self._index_lock:
+            self._index = None
+        logger.info("Embedding index written to %s (%s x %s)", matrix_path, *matrix.shape)
+        return matrix_path
+
+    def neighbours(self, words, top_n=2):
+        """Return {word: [nearest targets]} for every distinct word, excluding the word itself."""
+        words = list(dict.fromkeys(words))
+        if not words:
+            return {}
+        index = self.index
+        queries = self.encode(words)
+        with metrics.timed("flux_embedding_seconds", op="search"):
+            # One extra candidate so the word itself can be dropped
+            indices, _ = index.search(queries, top_n + 1)
+        return {word: [index.labels[i] for i in row if i >= 0 and index.labels[i] != word][:top_n]
+                for word, row in zip(words, indices.tolist())}
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_embedding_engine(model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE):
+    """Shared `EmbeddingEngine` per (model, device); set FLUX_EMBEDDING_ANN=1 to search with a faiss HNSW index."""
+    with _engines_lock:
+        engine = _engines.get((model, device))
+        if engine is None:
+            use_ann = os.environ.get(EMBEDDING_ANN_ENV, "") not in ("", "0")
+            engine = _engines[(model, device)] = EmbeddingEngine(model, device, use_ann=use_ann)
+        return engine
+
+
+def build_embedding_index(model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE, directory=EMBEDDING_DIR):
+    """Embed every expansion target with `model`'s encoder into `directory`; install.py does this for the default."""
+    return EmbeddingEngine(model, device, directory).build_index()
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    build_embedding_index(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FILL_MASK_MODEL)
@@ -0,0 +1,797 @@
+# flux_engine.py
+#
+# The conversion pipeline, independent of ComfyUI. `FluxPseudoNegativeEngine` holds the
+# shared phrase tables, system prompts and per-engine memo, and converts batches of prompt
+# pairs; the ComfyUI nodes in FluxPseudoNegative.py, the flux_cli.py command line tool and
+# the flux_server.py HTTP service are thin front ends over it.
+import hashlib
+import json
+import logging
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+# Heavy dependencies (nltk, transformers, torch, requests) are imported on first use
+from .flux_utils import (PhraseHandler, PromptTokens, StageTimer, TagAnalysis, strength_map, phrase_tokens, pos_tag,
+                         tag_intensity, prompt_weights, split_emphasis, weighted_tag, DEFAULT_INTENSITY)
+from .flux_models import (fill_mask_registry, batched_fill_mask, candidate_vocabulary, DEFAULT_FILL_MASK_MODEL,
+                          DEFAULT_DEVICE, DEFAULT_BATCH_SIZE, FILL_MASK_BACKENDS, FILL_MASK_VOCABULARIES,
+                          FILL_MASK_TEMPLATE, FILL_MASK_TOP_K)
+from .flux_embeddings import get_embedding_engine, EXPANSION_ENGINES
+from .flux_cache import AntonymCache, antonym_cache, result_cache
+from .flux_dictionaries import CustomDictionary, custom_dictionaries
+from .flux_sentiment import sentiment_lexicon, split_contractions
+from .flux_wordnet import wordnet_index
+from .flux_conceptnet import get_conceptnet_backend
+from .flux_metrics import metrics
+warnings.filterwarnings("ignore", message="torch.load doesn't support weights_only on this pytorch version, loading unsafely.")
+
+logger = logging.getLogger(__name__)
+
+ANTONYM_STRATEGY_CHAIN = "custom_dict>wordnet>nltk>transformer"
+# run_batch options that configure the ConversionState rather than the conversion itself
+STATE_OPTIONS = ("custom_antonyms", "fill_mask_batch_size", "fill_mask_backend", "fill_mask_vocabulary",
+                 "expansion_engine")
+# run_batch options besides the prompts, with their defaults; records passed to convert_records may set any of them
+RUN_OPTIONS = {"strength": 0.5, "complexity": "basic", "system_prompt_choice": "default", "custom_antonyms": None,
+               "use_conceptnet": False, "use_llm_full": False, "use_llm_fallback": False, "custom_system_prompt": None,
+               "fill_mask_batch_size": DEFAULT_BATCH_SIZE, "fill_mask_backend": FILL_MASK_BACKENDS[0],
+               "fill_mask_vocabulary": FILL_MASK_VOCABULARIES[0], "expansion_engine": EXPANSION_ENGINES[0]}
+RECORD_PROMPTS = ("negative_prompt", "positive_prompt")  # the keys of a convert_records record besides RUN_OPTIONS
+RUN_MEMO_SIZE = 8192  # per-engine memo of resolved tags and concept expansions from earlier runs
+WORKER_THREADS_ENV = "FLUX_WORKER_THREADS"
+DEFAULT_WORKER_THREADS = 8
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def data_version():
+    """Version of the data outputs depend on besides the inputs: strategy chain, indexes and dictionaries."""
+    return ":".join([ANTONYM_STRATEGY_CHAIN, _file_version(wordnet_index.path), _file_version(sentiment_lexicon.path),
+                     custom_dictionaries.signature()])
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """Bounded thread pool shared by all engines for I/O-bound work (FLUX_WORKER_THREADS threads)."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            workers = int(os.environ.get(WORKER_THREADS_ENV) or DEFAULT_WORKER_THREADS)
+            _worker_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="flux")
+        return _worker_pool
+
+
+def _reset_worker_pool():
+    # A forked child (e.g. a flux_cli.py worker process) inherits the pool but none of its threads
+    global _worker_pool, _worker_pool_lock
+    _worker_pool = None
+    _worker_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_worker_pool)
+
+
+class ConversionState:
+    """Options and memoized intermediate results of one conversion run.
+
+    An engine creates one per run and passes it to every step instead of keeping run state on
+    itself, so a single engine instance can serve concurrent runs.
+    """
+
+    def __init__(self, fill_mask_model=DEFAULT_FILL_MASK_MODEL, fill_mask_device=DEFAULT_DEVICE,
+                 fill_mask_backend=FILL_MASK_BACKENDS[0], fill_mask_vocabulary=FILL_MASK_VOCABULARIES[0],
+                 fill_mask_batch_size=DEFAULT_BATCH_SIZE, expansion_engine=EXPANSION_ENGINES[0], custom_antonyms=None):
+        self.fill_mask_model = fill_mask_model
+        self.fill_mask_device = fill_mask_device
+        self.fill_mask_backend = fill_mask_backend
+        self.fill_mask_vocabulary = fill_mask_vocabulary
+        self.fill_mask_batch_size = fill_mask_batch_size
+        self.expansion_engine = expansion_engine
+        self.custom_antonyms = custom_antonyms if custom_antonyms is not None else CustomDictionary()
+        # Persisted antonym cache entries are only valid for the WordNet index they were resolved with
+        self.wordnet_version = _file_version(wordnet_index.path)
+        self.fill_mask_results = {}
+        self.embedding_results = {}
+        self.lexical_results = {}
+        self.tag_analysis = None
+        self.transformer_errors = 0
+        self.conceptnet_errors = 0
+        self.summary = {}
+
+    @property
+    def custom_fingerprint(self):
+        return self.custom_antonyms.fingerprint
+
+    @property
+    def transformer_model(self):
+        return fill_mask_registry.get(self.fill_mask_model, self.fill_mask_device, self.fill_mask_backend)
+
+    @property
+    def candidate_vocabulary(self):
+        """Tokens fill-mask may return, or None to consider the model's whole vocabulary."""
+        if self.fill_mask_vocabulary == "full":
+            return None
+        return candidate_vocabulary(self.transformer_model, self.fill_mask_model)
+
+
+class FluxPseudoNegativeEngine:
+    """Converts negative prompts into positive ones. One engine can serve concurrent runs."""
+
+    def __init__(self, fill_mask_model=DEFAULT_FILL_MASK_MODEL, fill_mask_device=DEFAULT_DEVICE):
+        logger.debug("Initializing FluxPseudoNegativeEngine")
+        # The fill-mask pipeline is shared process-wide and only loaded on first use
+        self.fill_mask_model = fill_mask_model
+        self.fill_mask_device = fill_mask_device
+        # Everything else a run needs is kept in the ConversionState it is passed
+        self.last_run_summary = {}
+        # Resolved tags and concept expansions of earlier runs, so re-queuing an edited prompt
+        # only recomputes the tags that changed
+        self.run_memo = AntonymCache(max_size=RUN_MEMO_SIZE)
+        self.run_memo_version = None
+        self.phrase_handler = PhraseHandler()
+        logger.debug("PhraseHandler initialized")
+        self.strength_map = strength_map
+        logger.debug("Strength map initialized")
+        self.default_system_prompt = """
+        You are an AI assistant specializing in converting negative image prompts to positive ones. 
+        Your task is to take each word or phrase and transform it into its semantic opposite or a 
+        positive alternative that would result in the opposite visual effect in an image.
+        
+        Examples:
+        Input: "blurry, low quality, bad composition"
+        Output: "sharp, high quality, well-composed"
+        
+        Input: "oversaturated, noisy background, amateur lighting"
+        Output: "balanced colors, clean background, professional lighting"
+        
+        Now, please convert the following negative prompt to a positive one:
+        """
+        self.system_prompt_1 = """
+        You are an AI specialized in transforming negative image descriptions into positive ones. Your task is to convert each negative attribute or phrase into its positive counterpart, focusing on enhancing the visual qualities described.
+
+        Here are some examples:
+
+        Input: "poorly lit, amateur composition, dull colors"
+        Output: "brilliantly illuminated, expertly composed, vibrant palette"
+
+        Input: "grainy texture, flat perspective, cluttered scene"
+        Output: "smooth finish, dynamic depth, well-organized layout"
+
+        Input: "outdated style, harsh shadows, mundane subject"
+        Output: "contemporary aesthetic, soft lighting, captivating subject matter"
+
+        Now, please convert the following negative image description into a positive one:
+        """
+        self.system_prompt_2 = """
+        As an AI image prompt converter, your role is to reframe negative visual descriptions into positive, inspiring alternatives. For each element mentioned, envision its ideal counterpart that would enhance the image's appeal.
+
+        Consider these transformations:
+
+        Negative: "fuzzy edges, imbalanced composition, lifeless expressions"
+        Positive: "crisp contours, harmonious arrangement, animated expressions"
+
+        Negative: "washed-out sky, generic landscape, stiff posture"
+        Positive: "vivid celestial backdrop, unique terrain, natural and relaxed stance"
+
+        Negative: "overprocessed effects, cliché symbolism, awkward framing"
+        Positive: "subtle and refined editing, original metaphors, thoughtful and engaging composition"
+
+        Please apply this approach to convert the following negative description:
+        """
+        logger.debug("System prompts initialized")
+
+    def conversion_state(self, custom_antonyms=None, fill_mask_batch_size=DEFAULT_BATCH_SIZE,
+                         fill_mask_backend=FILL_MASK_BACKENDS[0], fill_mask_vocabulary=FILL_MASK_VOCABULARIES[0],
+                         expansion_engine=EXPANSION_ENGINES[0]):
+        """New per-run state for this engine's model; `custom_antonyms` is the inline dictionary text."""
+        # Compiled once per distinct text and dictionary directory contents
+        return ConversionState(self.fill_mask_model, self.fill_mask_device, fill_mask_backend, fill_mask_vocabulary,
+                               fill_mask_batch_size, expansion_engine, custom_dictionaries.load(custom_antonyms or ""))
+
+    def metrics_text(self, state=None):
+        """A run's summary as JSON, for the optional `metrics` output; the engine's latest run by default."""
+        return json.dumps(self.last_run_summary if state is None else state.summary, ensure_ascii=False)
+
+    def run_batch(self, prompt_pairs, strength, complexity, system_prompt_choice, custom_antonyms=None,
+                  use_conceptnet=False, use_llm_full=False, use_llm_fallback=False,
+                  custom_system_prompt=None, fill_mask_batch_size=DEFAULT_BATCH_SIZE,
+                  fill_mask_backend=FILL_MASK_BACKENDS[0], fill_mask_vocabulary=FILL_MASK_VOCABULARIES[0],
+                  expansion_engine=EXPANSION_ENGINES[0]):
+        """Convert a list of (positive_prompt, negative_prompt) pairs, returning (modified_prompt, llm_input) per pair.
+
+        Tags shared between prompts are resolved once, all transformer queries are batched,
+        and sentiment is analysed once per distinct negative prompt. Safe to call concurrently.
+        """
+        state = self.conversion_state(custom_antonyms, fill_mask_batch_size, fill_mask_backend, fill_mask_vocabulary,
+                                      expansion_engine)
+        return self.convert_batch(state, prompt_pairs, strength, complexity, system_prompt_choice, use_conceptnet,
+                                  use_llm_full, use_llm_fallback, custom_system_prompt)
+
+    def convert_records(self, records, **defaults):
+        """Convert dicts with a "negative_prompt", an optional "positive_prompt" and any RUN_OPTIONS.
+
+        A record with any other key is rejected with ValueError, so a misspelt option is not ignored.
+
+        Options missing from a record come from `defaults`, then RUN_OPTIONS. Records with the same
+        options are converted in one `run_batch` call. Returns (modified_prompt, llm_input) per record.
+        """
+        unknown = set(defaults) - set(RUN_OPTIONS)
+        if unknown:
+            raise TypeError(f"Unknown conversion options: {', '.join(sorted(unknown))}")
+        groups = {}
+        for index, record in enumerate(records):
+            if not isinstance(record, dict) or not isinstance(record.get("negative_prompt"), str):
+                raise ValueError(f"Record {index} needs a string negative_prompt")
+            unknown = set(record) - set(RUN_OPTIONS) - set(RECORD_PROMPTS)
+            if unknown:
+                raise ValueError(f"Record {index} has unknown keys: {', '.join(sorted(unknown))}")
+            options = {name: record.get(name, defaults.get(name, default)) for name, default in RUN_OPTIONS.items()}
+            key = json.dumps(options, sort_keys=True, default=repr)
+            groups.setdefault(key, (options, []))[1].append(index)
+        outputs = [None] * len(records)
+        for options, indices in groups.values():
+            pairs = [(records[index].get("positive_prompt") or "", records[index]["negative_prompt"])
+                     for index in indices]
+            for index, output in zip(indices, self.run_batch(pairs, **options)):
+                outputs[index] = output
+        return outputs
+
+    def convert_batch(self, state, prompt_pairs, strength, complexity, system_prompt_choice, use_conceptnet=False,
+                      use_llm_full=False, use_llm_fallback=False, custom_system_prompt=None):
+        """`run_batch` with an explicit `ConversionState`, which also receives the run summary.
+
+        All per-run state lives in `state`, so one engine can serve concurrent runs. Tags are resolved
+        on the calling thread; ConceptNet lookups and the antonym cache flush go to the worker pool.
+        """
+        logger.debug("Running batch of %s prompts with complexity: %s", len(prompt_pairs), complexity)
+        timer = StageTimer()
+        logger.debug("Custom antonyms: %s entries", len(state.custom_antonyms))
+        phrase_handler = state.custom_antonyms.phrase_handler or self.phrase_handler
+        pool = worker_pool()
+
+        # Conversions already made with the same inputs and data are answered from the result cache
+        version = data_version()
+        options = [strength, complexity, system_prompt_choice, use_conceptnet, use_llm_full, use_llm_fallback,
+                   custom_system_prompt, version]
+        if version != self.run_memo_version:
+            # Tags resolved against older indexes or dictionaries must not be reused
+            self.run_memo.clear()
+            self.run_memo_version = version
+        keys = {pair: self.result_cache_key(state, pair, options) for pair in dict.fromkeys(prompt_pairs)}
+        results = {pair: result_cache.get(key) for pair, key in keys.items()}
+        pending_pairs = [pair for pair, result in results.items() if result is None]
+        metrics.inc("flux_result_cache_total", len(results) - len(pending_pairs), result="hit")
+        metrics.inc("flux_result_cache_total", len(pending_pairs), result="miss")
+        errors = (state.transformer_errors, state.conceptnet_errors)
+        timer.stop("result_cache")
+
+        negatives = list(dict.fromkeys(negative for _, negative in pending_pairs))
+        # Each prompt is tokenised once; phrase matching, tagging and sentiment share the tokens
+        prompt_tokens = {}
+        tag_tokens = {}
+        pending_by_negative = {}
+        phrase_intensities = {}  # per negative prompt: phrase replacement -> intensity of the phrase
+        emphasis_by_negative = {}  # per negative prompt: tag written as `(tag:weight)` -> its weight
+        replacement_count = 0
+        for negative_prompt in negatives:
+            logger.debug("Processing negative prompt with phrase handler")
+            prompt = prompt_tokens[negative_prompt] = PromptTokens(negative_prompt)
+            processed, handled_tags, replacements = phrase_handler.replace_phrase_tokens(prompt)
+            logger.debug("Processed negative prompt: %s", processed.text)
+            logger.debug("Handled tags: %s", handled_tags)
+            logger.debug("Replacements: %s", replacements)
+            replacement_count += len(replacements)
+
+            # Emphasised tags are resolved without their brackets; their antonyms get the weight back
+            emphasis = emphasis_by_negative[negative_prompt] = {}
+            tags = []
+            for tag, tokens in processed.tags():
+                tag, tokens, weight = split_emphasis(tag, tokens)
+                if weight is not None:
+                    emphasis[tag] = weight
+                tags.append((tag, tokens))
+            logger.debug("Tags: %s", [tag for tag, _ in tags])
+            for tag, tokens in tags:
+                tag_tokens.setdefault(tag, tokens)
+            # Custom dictionary phrases are already positive, so their replacements skip the cascade and
+            # count as resolved. Built-in phrase replacements are dropped from the tags, as they always were.
+            replaced = phrase_intensities[negative_prompt] = {}
+            dropped = set()
+            for phrase, replacement in replacements.items():
+                if state.custom_antonyms.has_phrase(phrase):
+                    replaced[replacement] = max(replaced.get(replacement, 0.0), tag_intensity(phrase, self.strength_map))
+                else:
+                    dropped.add(replacement)
+            pending_by_negative[negative_prompt] = [tag for tag, _ in tags if tag not in handled_tags
+                                                    and (tag not in dropped or tag in replaced)]
+        timer.stop("phrases")
+
+        # Resolve every distinct tag once, with all transformer fallbacks in one batched call.
+        # Tags resolved by an earlier run with the same settings are reused as they are.
+        unique_tags = list(dict.fromkeys(tag for negative_prompt, pending in pending_by_negative.items()
+                                         for tag in pending if tag not in phrase_intensities[negative_prompt]))
+        resolved = {}
+        strategies = {}
+        for tag in unique_tags:
+            memo = self.run_memo.get(self.antonym_cache_key(state, "tag", tag))
+            if memo is not None:
+                resolved[tag], strategies[tag] = memo
+        new_tags = [tag for tag in unique_tags if tag not in resolved]
+        # POS-tag all multi-word tags in one batch
+        state.tag_analysis = TagAnalysis({tag: tag_tokens[tag] for tag in new_tags})
+        timer.stop("tag_analysis")
+        self.prefetch_fill_mask(state, [word for tag in new_tags for word in self.transformer_candidates(state, tag)])
+        # ConceptNet lookups are I/O bound: start each one as soon as its antonym is known
+        conceptnet_lookups = {}
+        conceptnet = get_conceptnet_backend() if use_conceptnet else None
+        conceptnet_errors = getattr(conceptnet, "errors", 0)
+
+        def lookup_related(antonym):
+            if conceptnet is not None and antonym not in conceptnet_lookups:
+                conceptnet_lookups[antonym] = pool.submit(conceptnet.antonyms, antonym, 3)
+
+        for replaced in phrase_intensities.values():
+            for replacement in replaced:
+                lookup_related(replacement)
+        for tag in unique_tags:
+            if tag not in resolved:
+                logger.debug("Processing tag: %s", tag)
+                tag_errors = state.transformer_errors
+                resolved[tag], strategies[tag] = self.get_antonym_cascade(state, tag)
+                logger.debug("Antonym found: %s (%s)", resolved[tag], strategies[tag])
+                if state.transformer_errors == tag_errors:
+                    self.run_memo.put(self.antonym_cache_key(state, "tag", tag), (resolved[tag], strategies[tag]))
+            if resolved[tag] != tag:
+                lookup_related(resolved[tag])
+        timer.stop("antonyms")
+        # Persist new antonym cache entries in the background while the prompts are assembled
+        cache_flush = pool.submit(antonym_cache.flush)
+
+        antonyms_by_negative = {}
+        unresolved_by_negative = {}
+        intensities_by_negative = {}
+        antonym_emphasis_by_negative = {}
+        for negative_prompt, pending in pending_by_negative.items():
+            # How negative each source tag was, for expert mode's prompt weights. Kept per prompt so a
+            # prompt converts the same whether or not it shares a batch with others.
+            intensities = dict(phrase_intensities[negative_prompt])
+            emphasis = emphasis_by_negative[negative_prompt]
+            antonym_emphasis = {}
+            antonyms = []
+            unresolved_tags = []
+            for tag in pending:
+                if tag in phrase_intensities[negative_prompt]:
+                    antonyms.append(tag)
+                elif resolved[tag] != tag:
+                    antonyms.append(resolved[tag])
+                    words = [word.lower() for word in tag_tokens[tag]]
+                    intensities[resolved[tag]] = max(intensities.get(resolved[tag], 0.0),
+                                                     tag_intensity(tag, self.strength_map, words))
+                else:
+                    unresolved_tags.append(weighted_tag(tag, emphasis[tag]) if tag in emphasis else tag)
+                    continue
+                if tag in emphasis:
+                    antonym_emphasis[antonyms[-1]] = emphasis[tag]
+            intensities_by_negative[negative_prompt] = intensities
+            antonym_emphasis_by_negative[negative_prompt] = antonym_emphasis
+            logger.debug("Antonyms found: %s", antonyms)
+            logger.debug("Unresolved tags: %s", unresolved_tags)
+            if use_conceptnet:
+                logger.debug("Expanding with ConceptNet")
+                antonyms = self.expand_with_conceptnet(state, antonyms, {antonym: conceptnet_lookups[antonym].result()
+                                                                         for antonym in antonyms})
+                logger.debug("Expanded antonyms: %s", antonyms)
+            antonyms_by_negative[negative_prompt] = antonyms
+            unresolved_by_negative[negative_prompt] = unresolved_tags
+        if use_conceptnet:
+            state.conceptnet_errors += getattr(conceptnet, "errors", 0) - conceptnet_errors
+        timer.stop("conceptnet" if use_conceptnet else "collect")
+
+        if complexity != "basic":
+            self.prefetch_expansions(state, [antonym for antonyms in antonyms_by_negative.values() for antonym in antonyms])
+            timer.stop("expansion_prefetch")
+
+        logger.debug("Analyzing sentiment")
+        sentiments = {negative_prompt: self.analyze_sentiment(negative_prompt, prompt_tokens[negative_prompt].tokens)
+                      for negative_prompt in negatives}
+        logger.debug("Sentiment: %s", sentiments)
+        timer.stop("sentiment")
+
+        for positive_prompt, negative_prompt in pending_pairs:
+            antonyms = antonyms_by_negative[negative_prompt]
+            unresolved_tags = unresolved_by_negative[negative_prompt]
+
+            antonym_emphasis = antonym_emphasis_by_negative[negative_prompt]
+
+            if complexity == "basic":
+                logger.debug("Using basic processing")
+                result = self.basic_processing(antonyms, positive_prompt, antonym_emphasis)
+            elif complexity == "advanced":
+                logger.debug("Using advanced processing")
+                result = self.advanced_processing(state, antonyms, positive_prompt, antonym_emphasis)
+            else:  # expert
+                logger.debug("Using expert processing")
+                intensities = intensities_by_negative[negative_prompt]
+                weights = prompt_weights([intensities.get(antonym, DEFAULT_INTENSITY) for antonym in antonyms],
+                                         sentiments[negative_prompt], strength)
+                # A weight written in the prompt replaces the computed one
+                weights = [antonym_emphasis.get(antonym, weight) for antonym, weight in zip(antonyms, weights)]
+                result = self.expert_processing(state, antonyms, positive_prompt, weights)
+
+            logger.debug("Processing result: %s", result)
+
+            llm_input = ""
+            if use_llm_full or (use_llm_fallback and unresolved_tags):
+                logger.debug("Preparing LLM input")
+                used_system_prompt = custom_system_prompt if custom_system_prompt else getattr(self, f"system_prompt_{system_prompt_choice}", self.default_system_prompt)
+                if use_llm_full:
+                    llm_input = f"{used_system_prompt}\n\n{negative_prompt}"
+                else:
+                    llm_input = f"{used_system_prompt}\n\n{', '.join(unresolved_tags)}"
+                logger.debug("LLM input prepared: %s", llm_input)
+            results[(positive_prompt, negative_prompt)] = (result, llm_input)
+        timer.stop("processing")
+
+        if (state.transformer_errors, state.conceptnet_errors) == errors:  # don't remember degraded results
+            for pair in pending_pairs:
+                result_cache.put(keys[pair], results[pair])
+
+        cache_flush.result()
+        timer.stop("cache_flush")
+
+        cache_stats = antonym_cache.stats()
+        state.summary = self.last_run_summary = {
+            "prompts": len(prompt_pairs),
+            "cached_prompts": len(results) - len(pending_pairs),
+            "complexity": complexity,
+            "tags": len(unique_tags),
+            "reused_tags": len(unique_tags) - len(new_tags),
+            "phrase_replacements": replacement_count,
+            "strategies": strategies,
+            "stage_ms": timer.as_milliseconds(),
+            "total_ms": round(timer.total() * 1000, 3),
+            "antonym_cache": cache_stats,
+        }
+        self.record_metrics(timer, len(prompt_pairs), len(unique_tags), cache_stats)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("run summary %s", json.dumps(state.summary, ensure_ascii=False))
+        return [results[pair] for pair in prompt_pairs]
+
+    def result_cache_key(self, state, pair, options):
+        """Result cache key of one (positive, negative) pair: a hash of the pair, the run options and the models."""
+        payload = json.dumps([list(pair), options, state.fill_mask_model, state.fill_mask_device, state.fill_mask_backend,
+                              state.fill_mask_vocabulary, state.expansion_engine, state.custom_fingerprint],
+                             ensure_ascii=False)
+        return ("result", hashlib.sha1(payload.encode("utf-8")).hexdigest())
+
+    def record_metrics(self, timer, prompt_count, tag_count, cache_stats):
+        for stage, seconds in timer.seconds.items():
+            metrics.observe("flux_stage_seconds", seconds, stage=stage)
+        metrics.observe("flux_run_seconds", timer.total())
+        metrics.inc("flux_prompts_total", prompt_count)
+        metrics.inc("flux_tags_total", tag_count)
+        metrics.set_gauge("flux_antonym_cache_hits", cache_stats["hits"])
+        metrics.set_gauge("flux_antonym_cache_misses", cache_stats["misses"])
+        metrics.set_gauge("flux_antonym_cache_size", cache_stats["size"])
+        metrics.publish()
+
+    def tag_words(self, state, tag):
+        """Words of `tag`, from the run's tag analysis when it covers the tag."""
+        if state.tag_analysis is not None and tag in state.tag_analysis:
+            return state.tag_analysis.tag_words(tag)
+        return phrase_tokens(tag)
+
+    def tagged_words(self, state, tag, words):
+        """(word, POS) pairs of a multi-word `tag`, from the run's tag analysis when it covers the tag."""
+        if state.tag_analysis is not None and tag in state.tag_analysis:
+            return state.tag_analysis.tagged_words(tag)
+        return pos_tag(words)
+
+    def get_antonym_cascade(self, state, tag):
+        """Resolve `tag`, returning (antonym, name of the strategy that resolved it)."""
+        words = self.tag_words(state, tag)
+        if len(words) == 1:
+            return self.get_single_word_antonym(state, words[0])
+        else:
+            return self.get_multi_word_antonym(state, words, self.tagged_words(state, tag, words))
+
+    def antonym_cache_key(self, state, kind, text):
+        return (kind, text, f"{ANTONYM_STRATEGY_CHAIN}:{state.wordnet_version}:{state.fill_mask_model}:"
+                f"{state.fill_mask_backend}:{state.fill_mask_vocabulary}", state.custom_fingerprint)
+
+    def get_single_word_antonym(self, state, word):
+        key = self.antonym_cache_key(state, "word", word)
+        # Cached antonyms keep the strategy that resolved them, so strategy counts don't depend on the cache
+        cached = antonym_cache.get(key)
+        metrics.inc("flux_antonym_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            antonym, strategy = cached
+            metrics.inc("flux_antonym_strategy_total", strategy=strategy)
+            return antonym, strategy
+        errors = state.transformer_errors
+        antonym, strategy = self.get_lexical_antonym(state, word)
+        if antonym == word:
+            antonym = self.transformer_strategy(state, word)
+            strategy = "transformer" if antonym != word else "unresolved"
+        if state.transformer_errors == errors:  # don't remember transient model failures
+            antonym_cache.put(key, (antonym, strategy))
+        metrics.inc("flux_antonym_strategy_total", strategy=strategy)
+        return antonym, strategy
+
+    def get_lexical_antonym(self, state, word):
+        """Run the dictionary-based strategies, memoized for the current run.
+
+        Returns (antonym, strategy name), with the word itself and None when none of them resolves it.
+        """
+        if word in state.lexical_results:
+            return state.lexical_results[word]
+        result = (word, None)
+        for name, method in [("custom_dict", self.custom_dict_strategy), ("wordnet", self.wordnet_strategy),
+                             ("nltk", self.nltk_strategy)]:
+            antonym = method(state, word)
+            if antonym != word:
+                result = (antonym, name)
+                break
+        state.lexical_results[word] = result
+        return result
+
+    def transformer_candidates(self, state, tag):
+        """Words of `tag` that the cascade may send to the transformer strategy."""
+        words = self.tag_words(state, tag)
+        kind = "word" if len(words) == 1 else "phrase"
+        if self.antonym_cache_key(state, kind, ' '.join(words)) in antonym_cache:
+            return []
+        if len(words) > 1:
+            words = [word for word, pos in self.tagged_words(state, tag, words) if pos.startswith('JJ') or pos.startswith('RB')]
+        candidates = []
+        for word in words:
+            if self.get_lexical_antonym(state, word)[0] != word:
+                break  # the cascade stops at the first lexically resolved word
+            candidates.append(word)
+        return candidates
+
+    def prefetch_fill_mask(self, state, words):
+        pending = [word for word in dict.fromkeys(words) if word not in state.fill_mask_results]
+        if not pending:
+            return
+        logger.debug("Batched fill-mask for %s words", len(pending))
+        try:
+            state.fill_mask_results.update(batched_fill_mask(state.transformer_model, pending,
+                                                            batch_size=state.fill_mask_batch_size,
+                                                            vocabulary=state.candidate_vocabulary))
+        except Exception as e:
+            state.transformer_errors += 1
+            logger.warning("Error in batched fill-mask, falling back to per-word queries: %s", e)
+
+    def prefetch_expansions(self, state, words):
+        """Prefetch `expand_concept` for `words` with the selected expansion engine."""
+        words = [word for word in words if self.expansion_memo_key(state, word) not in self.run_memo]
+        if state.expansion_engine == "fill_mask":
+            self.prefetch_fill_mask(state, words)
+            return
+        pending = [word for word in dict.fromkeys(words) if word not in state.embedding_results]
+        if not pending:
+            return
+        logger.debug("Embedding search for %s words", len(pending))
+        try:
+            engine = get_embedding_engine(state.fill_mask_model, state.fill_mask_device)
+            state.embedding_results.update(engine.neighbours(pending, top_n=FILL_MASK_TOP_K))
+        except LookupError:
+            raise  # the embedding index was not built; see install.py
+        except Exception as e:
+            state.transformer_errors += 1
+            logger.warning("Error in embedding search, falling back to per-word queries: %s", e)
+
+    def fill_mask(self, state, word, top_k=FILL_MASK_TOP_K):
+        results = state.fill_mask_results.get(word)
+        if results is not None and top_k <= FILL_MASK_TOP_K:
+            return results[:top_k]
+        metrics.inc("flux_model_queries_total", mode="single")
+        with metrics.timed("flux_model_call_seconds", mode="single"):
+            vocabulary = state.candidate_vocabulary
+            if vocabulary is not None:
+                return vocabulary.fill_mask(state.transformer_model, [FILL_MASK_TEMPLATE.format(word)], top_k=top_k)[0]
+            return state.transformer_model(FILL_MASK_TEMPLATE.format(word), top_k=top_k)
+
+    def get_multi_word_antonym(self, state, words, pos_tags=None):
+        key = self.antonym_cache_key(state, "phrase", ' '.join(words))
+        cached = antonym_cache.get(key)
+        if cached is not None:
+            return cached
+        errors = state.transformer_errors
+        result = ' '.join(words)
+        strategy = "unresolved"
+        if pos_tags is None:
+            pos_tags = pos_tag(words)
+        for word, pos in pos_tags:
+            if pos.startswith('JJ') or pos.startswith('RB'):  # Adjective or adverb
+                antonym, word_strategy = self.get_single_word_antonym(state, word)
+                if antonym != word:
+                    result = ' '.join([antonym if w == word else w for w in words])
+                    strategy = word_strategy
+                    break
+        if state.transformer_errors == errors:
+            antonym_cache.put(key, (result, strategy))
+        return result, strategy
+
+    def custom_dict_strategy(self, state, word):
+        logger.debug("Using custom dict strategy for word: %s", word)
+        result = state.custom_antonyms.get(word, word)
+        logger.debug("Custom dict strategy result: %s", result)
+        return result
+
+    def wordnet_strategy(self, state, word):
+        logger.debug("Using WordNet strategy for word: %s", word)
+        entry = wordnet_index.lookup(word)
+        if entry:
+            result = entry[0]  # Most common antonym
+        else:
+            # Custom antonyms for words that WordNet doesn't handle well
+            custom_antonyms = {
+                'disfigured': 'well-formed',
+                'blurry': 'sharp',
+                'poor': 'excellent',
+                'anatomy': 'structure',
+                'excellent': 'poor',
+                'quality': 'high-quality',
+                'overexposed': 'well-exposed',
+                'correct': 'incorrect',
+                'high': 'low',
+                'low': 'high',
+                'worst': 'best',
+                'best': 'worst',
+                'mutated': 'normal',
+            }
+            result = custom_antonyms.get(word, word)
+        
+        logger.debug("WordNet strategy result: %s", result)
+        return result
+
+    def nltk_strategy(self, state, word):
+        logger.debug("Using NLTK strategy for word: %s", word)
+        entry = wordnet_index.lookup(word)
+        result = entry[1] if entry else word  # First antonym
+        logger.debug("NLTK strategy result: %s", result)
+        return result
+
+    def transformer_strategy(self, state, word):
+        logger.debug("Using transformer strategy for word: %s", word)
+        try:
+            results = self.fill_mask(state, word)
+            logger.debug("Transformer results: %s", results)
+            for result in results:
+                if result['token_str'] != word and result['token_str'].isalpha() and len(result['token_str']) > 2:
+                    logger.debug("Transformer strategy result: %s", result['token_str'])
+                    return result['token_str']
+        except Exception as e:
+            state.transformer_errors += 1
+            logger.warning("Error in transformer strategy: %s", e)
+        logger.debug("Transformer strategy fallback to original word: %s", word)
+        return word
+
+    def expand_with_conceptnet(self, state, words, related=None):
+        """Add the ConceptNet antonyms of `words`; `related` maps words to lookups already made."""
+        logger.debug("Expanding with ConceptNet for words: %s", words)
+        if related is None:
+            # All words are looked up concurrently (or offline, see flux_conceptnet.py)
+            backend = get_conceptnet_backend()
+            errors = getattr(backend, "errors", 0)
+            related = backend.antonyms_many(words, limit=3)  # Limit to top 3 related concepts
+            state.conceptnet_errors += getattr(backend, "errors", 0) - errors
+        expanded = [concept for word in words for concept in related[word]]
+        result = list(dict.fromkeys(words + expanded))  # stable order, unlike set()
+        logger.debug("ConceptNet expansion result: %s", result)
+        return result
+
+    def analyze_sentiment(self, text, tokens=None):
+        """Sentiment of `text`; pass its `PromptTokens.tokens` to skip tokenising it again."""
+        logger.debug("Analyzing sentiment for text: %s", text)
+        if tokens is None:
+            sentiment = sentiment_lexicon.score(text)
+        else:
+            sentiment = sentiment_lexicon.score_tokens(split_contractions([token.lower() for token in tokens]))
+        logger.debug("Sentiment analysis result: %s", sentiment)
+        return sentiment
+
+    def basic_processing(self, antonyms, positive_prompt, emphasis=None):
+        logger.debug("Performing basic processing")
+        unique_antonyms = list(dict.fromkeys(antonyms))  # Remove duplicates while preserving order
+        antonym_phrase = ", ".join(self.emphasised(unique_antonyms, emphasis))
+        result = f"{positive_prompt}, {antonym_phrase}"
+        logger.debug("Basic processing result: %s", result)
+        return result
+
+    def advanced_processing(self, state, antonyms, positive_prompt, emphasis=None):
+        logger.debug("Performing advanced processing")
+        self.prefetch_expansions(state, antonyms)
+        expanded_antonyms = [word for antonym in antonyms for word in self.expand_concept(state, antonym)]
+        # Filter out duplicates and very short words
+        expanded_antonyms = list(dict.fromkeys([word for word in expanded_antonyms if len(word) > 2]))
+        logger.debug("Expanded antonyms: %s", expanded_antonyms)
+        antonym_phrase = ", ".join(self.emphasised(expanded_antonyms, emphasis))
+        result = f"{positive_prompt}, {antonym_phrase}"
+        logger.debug("Advanced processing result: %s", result)
+        return result
+
+    def emphasised(self, antonyms, emphasis=None):
+        """`antonyms` with the weights of the `(tag:weight)` tags they came from put back."""
+        if not emphasis:
+            return antonyms
+        return [weighted_tag(antonym, emphasis[antonym]) if antonym in emphasis else antonym for antonym in antonyms]
+
+    def expert_processing(self, state, antonyms, positive_prompt, weights=None):
+        logger.debug("Performing expert processing")
+        self.prefetch_expansions(state, antonyms)
+        weights = weights or [1.0] * len(antonyms)
+        # Each antonym keeps its weight; the concepts it expands to get half of its boost
+        expanded_antonyms = [(word, weight if index == 0 else round(1.0 + (weight - 1.0) / 2, 2))
+                             for antonym, weight in zip(antonyms, weights)
+                             for index, word in enumerate(self.expand_concept(state, antonym))]
+        logger.debug("Expanded antonyms: %s", expanded_antonyms)
+        weighted_antonyms = [weighted_tag(antonym, weight) for antonym, weight in expanded_antonyms]
+        logger.debug("Weighted antonyms: %s", weighted_antonyms)
+        antonym_phrase = ", ".join(weighted_antonyms)
+        result = f"{positive_prompt}, {antonym_phrase}"
+        logger.debug("Expert processing result: %s", result)
+        return result
+
+    def expansion_memo_key(self, state, word, top_n=2):
+        return ("expansion", word, f"{state.expansion_engine}:{state.fill_mask_model}:{state.fill_mask_backend}:"
+                f"{state.fill_mask_vocabulary}:{top_n}", "")
+
+    def expand_concept(self, state, word, top_n=2):
+        logger.debug("Expanding concept for word: %s", word)
+        key = self.expansion_memo_key(state, word, top_n)
+        memo = self.run_memo.get(key)
+        if memo is not None:
+            return list(memo)
+        try:
+            if state.expansion_engine == "embeddings":
+                neighbours = state.embedding_results.get(word)
+                if neighbours is None:
+                    engine = get_embedding_engine(state.fill_mask_model, state.fill_mask_device)
+                    neighbours = engine.neighbours([word], top_n=top_n)[word]
+                result = [word] + neighbours[:top_n]
+            else:
+                similar_words = self.fill_mask(state, word, top_k=top_n)
+                result = [word] + [result['token_str'] for result in similar_words if result['token_str'] != word]
+            logger.debug("Concept expansion result: %s", result)
+            self.run_memo.put(key, tuple(result))
+            return result
+        except LookupError:
+            raise
+        except Exception as e:
+            # Counted so neither this degraded expansion nor the run's results are cached
+            state.transformer_errors += 1
+            logger.warning("Error in concept expansion: %s", e)
+            return [word]
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def default_engine():
+    """The process-wide engine behind `convert_prompts`, created on first use."""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = FluxPseudoNegativeEngine()
+        return _default_engine
+
+
+def convert_prompts(prompt_pairs, strength=0.5, complexity="basic", system_prompt_choice="default", **options):
+    """Convert (positive_prompt, negative_prompt) pairs with a shared engine, returning results in input order."""
+    return default_engine().run_batch(list(prompt_pairs), strength, complexity, system_prompt_choice, **options)
@@ -0,0 +1,182 @@
+# flux_metrics.py
+import contextlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE_ENV = "FLUX_METRICS_FILE"
+PROFILE_DIR_ENV = "FLUX_PROFILE_DIR"
+PROFILERS = ["off", "cprofile", "pyinstrument"]
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in key) + "}"
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and latency summaries, published to pluggable sinks after each run."""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            count, total = self._summaries.get(key, (0, 0.0))
+            self._summaries[key] = (count + 1, total + seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name, **labels):
+        """Observe the duration of the block; an `outcome` label of "ok" or "error" is added."""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": dict(self._summaries),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+    def to_prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, key), value in sorted(metrics.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        for name in sorted({name for name, _ in snapshot["summaries"]}):
+            lines.append(f"# TYPE {name} summary")
+            for (metric, key), (count, total) in sorted(snapshot["summaries"].items()):
+                if metric == name:
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def add_sink(self, sink):
+        """Register a callable taking the registry; it is called by `publish()`."""
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self._sinks.remove(sink)
+
+    def publish(self):
+        for sink in list(self._sinks):
+            try:
+                sink(self)
+            except Exception as e:
+                logger.warning("Metrics sink %r failed: %s", sink, e)
+
+
+class PrometheusFileSink:
+    """Writes the registry in Prometheus text format, e.g. for node_exporter's textfile collector."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, registry):
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(registry.to_prometheus_text())
+        os.replace(tmp_path, self.path)
+
+    def __repr__(self):
+        return f"PrometheusFileSink({self.path!r})"
+
+
+# cProfile and pyinstrument hook the whole interpreter, so only one run is profiled at a time
+_profile_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profile_run(profiler="off", directory=None):
+    """Profile the enclosed block with cProfile (.prof) or pyinstrument (.html) and log the output path.
+
+    While another run is being profiled, the block runs unprofiled with a warning.
+    """
+    if profiler == "off":
+        yield None
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning("Another run is being profiled; running without the %s profiler", profiler)
+        yield None
+        return
+    try:
+        directory = directory or os.environ.get(PROFILE_DIR_ENV) or tempfile.gettempdir()
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        if profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            session = Profiler()
+            session.start()
+            try:
+                yield session
+            finally:
+                session.stop()
+                path = os.path.join(directory, f"flux_pseudo_negative-{stamp}-{os.getpid()}.html")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(session.output_html())
+                logger.info("pyinstrument flamegraph written to %s", path)
+        else:
+            import cProfile
+            session = cProfile.Profile()
+            session.enable()
+            try:
+                yield session
+            finally:
+                session.disable()
+                path = os.path.join(directory, f"flux_pseudo_negative-{stamp}-{os.getpid()}.prof")
+                session.dump_stats(path)
+                logger.info("cProfile stats written to %s (view with snakeviz or flameprof)", path)
+    finally:
+        _profile_lock.release()
+
+
+metrics = MetricsRegistry()
+if os.environ.get(METRICS_FILE_ENV):
+    metrics.add_sink(PrometheusFileSink(os.environ[METRICS_FILE_ENV]))
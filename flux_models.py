@@ -0,0 +1,354 @@
+# flux_models.py
+import gc
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    from .flux_metrics import metrics
+    from .flux_utils import strength_map, user_cache_dir
+    from .flux_wordnet import modifier_words
+except ImportError:  # imported by install.py
+    from flux_metrics import metrics
+    from flux_utils import strength_map, user_cache_dir
+    from flux_wordnet import modifier_words
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILL_MASK_MODEL = "bert-base-uncased"
+DEFAULT_DEVICE = -1  # CPU, same as the transformers pipeline default
+# "transformers" is the PyTorch pipeline; the ONNX Runtime variants are exported on first use
+FILL_MASK_BACKENDS = ["transformers", "onnx", "onnx-int8"]
+DEFAULT_BACKEND = "transformers"
+DEFAULT_BATCH_SIZE = 32
+MODEL_IDLE_ENV = "FLUX_MODEL_IDLE_SECONDS"
+IDLE_CHECK_INTERVAL = 60.0  # longest wait between idle checks, in seconds
+# "adjectives" scores only single-token WordNet adjectives/adverbs, "full" the whole tokenizer vocabulary
+FILL_MASK_VOCABULARIES = ["full", "adjectives"]
+# Vocabularies install.py builds for the default model; other models' are cached in user_cache_dir("vocabulary")
+VOCABULARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "vocabulary")
+FILL_MASK_TEMPLATE = "The opposite of {} is [MASK]."
+FILL_MASK_TOP_K = 5  # the fill-mask pipeline default, used by transformer_strategy
+
+
+def _resident_memory_bytes():
+    """Current resident set size of this process, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def _parameter_bytes(pipe):
+    model = getattr(pipe, "model", None)
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class _ModelEntry:
+    __slots__ = ("pipe", "load_seconds", "parameter_bytes", "rss_delta_bytes", "last_used")
+
+    def __init__(self, pipe, load_seconds, parameter_bytes, rss_delta_bytes):
+        self.pipe = pipe
+        self.load_seconds = load_seconds
+        self.parameter_bytes = parameter_bytes
+        self.rss_delta_bytes = rss_delta_bytes
+        self.last_used = time.monotonic()
+
+
+def load_fill_mask(model, device, backend=DEFAULT_BACKEND):
+    if backend == "transformers":
+        from transformers import pipeline
+        return pipeline("fill-mask", model=model, tokenizer=model, device=device)
+    if backend in ("onnx", "onnx-int8"):
+        from .flux_onnx import OnnxFillMask
+        return OnnxFillMask(model, device, quantize=backend == "onnx-int8")
+    raise ValueError(f"Unknown fill-mask backend {backend!r}, expected one of {FILL_MASK_BACKENDS}")
+
+
+class FillMaskRegistry:
+    """Process-wide registry holding one lazily created fill-mask pipeline per (model, device, backend).
+
+    With `idle_seconds`, a background thread unloads models that have not been used for that long.
+    """
+
+    def __init__(self, loader=None, idle_seconds=0):
+        self._loader = loader or load_fill_mask
+        self.idle_seconds = idle_seconds
+        self._entries = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._idle_thread = None
+
+    def get(self, model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE, backend=DEFAULT_BACKEND):
+        key = (model, device, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                return entry.pipe
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        # Only loads of the same key wait for each other; loaded models stay available meanwhile
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                logger.info("Loading fill-mask model %s on device %s with the %s backend...", model, device, backend)
+                rss_before = _resident_memory_bytes()
+                start = time.perf_counter()
+                pipe = self._loader(model, device, backend)
+                load_seconds = time.perf_counter() - start
+                entry = _ModelEntry(pipe, load_seconds, _parameter_bytes(pipe),
+                                    max(_resident_memory_bytes() - rss_before, 0))
+                with self._lock:
+                    self._entries[key] = entry
+                logger.info("Fill-mask model loaded in %.2fs (%.1f MiB parameters, %.1f MiB resident)",
+                            load_seconds, entry.parameter_bytes / 2**20, entry.rss_delta_bytes / 2**20)
+                self._start_idle_thread()
+        entry.last_used = time.monotonic()
+        return entry.pipe
+
+    def is_loaded(self, model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE, backend=DEFAULT_BACKEND):
+        return (model, device, backend) in self._entries
+
+    def unload(self, model=DEFAULT_FILL_MASK_MODEL, device=DEFAULT_DEVICE, backend=DEFAULT_BACKEND):
+        with self._lock:
+            entry = self._entries.pop((model, device, backend), None)
+        if entry is None:
+            return False
+        del entry
+        self._collect()
+        logger.info("Fill-mask model %s on device %s (%s) unloaded", model, device, backend)
+        return True
+
+    def unload_idle(self, max_idle_seconds):
+        """Unload every model not used within the last `max_idle_seconds`; returns the unloaded keys."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if now - entry.last_used >= max_idle_seconds]
+            for key in idle:
+                del self._entries[key]
+        if idle:
+            self._collect()
+            logger.info("Unloaded idle fill-mask models: %s", idle)
+        return idle
+
+    def _start_idle_thread(self):
+        if self.idle_seconds <= 0:
+            return
+        with self._lock:
+            # A forked child inherits the attribute but not the thread
+            if self._idle_thread is not None and self._idle_thread.is_alive():
+                return
+            self._idle_thread = threading.Thread(target=self._unload_idle_loop, name="flux-model-idle", daemon=True)
+            self._idle_thread.start()
+
+    def _unload_idle_loop(self):
+        while True:
+            time.sleep(min(self.idle_seconds, IDLE_CHECK_INTERVAL))
+            self.unload_idle(self.idle_seconds)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{model}@{device}/{backend}": {
+                    "load_seconds": entry.load_seconds,
+                    "parameter_bytes": entry.parameter_bytes,
+                    "rss_delta_bytes": entry.rss_delta_bytes,
+                    "idle_seconds": now - entry.last_used,
+                }
+                for (model, device, backend), entry in self._entries.items()
+            }
+
+    @staticmethod
+    def _collect():
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+def gather_mask_scores(pipe, texts, token_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Probability of each of `token_ids` at the [MASK] of every text, as an (n_texts, n_ids) array.
+
+    The softmax is over the full vocabulary, as in the pipeline, but only the requested columns
+    are gathered from the mask logits.
+    """
+    if hasattr(pipe, "gather_scores"):  # OnnxFillMask
+        return pipe.gather_scores(texts, token_ids, batch_size)
+    import numpy as np
+    import torch
+
+    tokenizer, model = pipe.tokenizer, pipe.model
+    index = torch.as_tensor(token_ids, device=model.device)
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(texts[start:start + batch_size], padding=True, return_tensors="pt").to(model.device)
+            logits = model(**encoded).logits
+            rows, positions = (encoded["input_ids"] == tokenizer.mask_token_id).nonzero(as_tuple=True)
+            mask_logits = logits[rows, positions].float()
+            scores = (mask_logits.index_select(1, index) - mask_logits.logsumexp(1, keepdim=True)).exp()
+            chunks.append(scores.cpu().numpy())
+    return np.concatenate(chunks)
+
+
+class CandidateVocabulary:
+    """Token ids the fill-mask strategies may return, scored with one gather over the mask logits."""
+
+    def __init__(self, token_ids, tokens):
+        self.token_ids = token_ids
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def fill_mask(self, pipe, texts, top_k=FILL_MASK_TOP_K, batch_size=DEFAULT_BATCH_SIZE):
+        """Top-k candidates per text, in the same format as the fill-mask pipeline."""
+        import numpy as np
+
+        if not self.tokens:
+            return [[] for _ in texts]
+        scores = gather_mask_scores(pipe, texts, self.token_ids, batch_size)
+        top_k = min(top_k, len(self.tokens))
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable"),
+                                 axis=1)
+        return [[{"score": float(row_scores[i]), "token": int(self.token_ids[i]), "token_str": self.tokens[i],
+                  "sequence": text.replace("[MASK]", self.tokens[i])} for i in row]
+                for text, row, row_scores in zip(texts, top.tolist(), scores)]
+
+
+def build_candidate_vocabulary(tokenizer, words):
+    """Collect the single-token entries of `words` (compared lowercased) in the tokenizer's vocabulary."""
+    import numpy as np
+
+    special = set(tokenizer.all_special_ids)
+    token_ids, tokens = [], []
+    for token, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1]):
+        text = tokenizer.convert_tokens_to_string([token]).strip()
+        if token_id not in special and len(text) > 2 and text.isalpha() and text.lower() in words:
+            token_ids.append(token_id)
+            tokens.append(text)
+    return CandidateVocabulary(np.array(token_ids, dtype=np.int64), tokens)
+
+
+def vocabulary_path(directory, model):
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "--", model) + ".npz")
+
+
+def candidate_words():
+    """Words the "adjectives" vocabulary is built from: the WordNet modifier words and the strength map's words."""
+    return modifier_words() | {word for word in strength_map if word.isalpha()}
+
+
+def write_candidate_vocabulary(path, vocabulary, vocab_size):
+    import numpy as np
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}.npz"
+    np.savez(tmp_path, token_ids=vocabulary.token_ids, tokens=np.array(vocabulary.tokens), vocab_size=vocab_size)
+    os.replace(tmp_path, path)
+
+
+def build_vocabulary_file(model=DEFAULT_FILL_MASK_MODEL, directory=VOCABULARY_DIR):
+    """Build the "adjectives" vocabulary of `model` into `directory`; install.py runs this for the default model."""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    vocabulary = build_candidate_vocabulary(tokenizer, candidate_words())
+    path = vocabulary_path(directory, model)
+    write_candidate_vocabulary(path, vocabulary, len(tokenizer))
+    logger.info("Fill-mask candidate vocabulary for %s written to %s (%s tokens)", model, path, len(vocabulary))
+    return path
+
+
+def load_candidate_vocabulary(tokenizer, model):
+    """The adjective/adverb vocabulary of `model`.
+
+    Read from the vocabularies install.py built, then from the user cache. A model neither has is
+    built from `candidate_words()` and cached in the user cache, or only kept in memory when that
+    cannot be written.
+    """
+    import numpy as np
+
+    vocab_size = len(tokenizer)
+    cache_path = vocabulary_path(user_cache_dir("vocabulary"), model)
+    for path in (vocabulary_path(VOCABULARY_DIR, model), cache_path):
+        if os.path.exists(path):
+            with np.load(path) as data:
+                # A retrained tokenizer saved under the same name invalidates the file
+                if int(data["vocab_size"]) == vocab_size:
+                    return CandidateVocabulary(data["token_ids"], data["tokens"].tolist())
+    vocabulary = build_candidate_vocabulary(tokenizer, candidate_words())
+    try:
+        write_candidate_vocabulary(cache_path, vocabulary, vocab_size)
+        logger.info("Fill-mask candidate vocabulary for %s cached in %s (%s tokens)", model, cache_path, len(vocabulary))
+    except OSError as e:
+        logger.warning("Could not cache the fill-mask candidate vocabulary for %s: %s", model, e)
+    return vocabulary
+
+
+_vocabularies = {}
+_vocabulary_lock = threading.Lock()
+
+
+def candidate_vocabulary(pipe, model):
+    """Shared `CandidateVocabulary` for `model`; the tokenizer is the same for every backend."""
+    with _vocabulary_lock:
+        vocabulary = _vocabularies.get(model)
+        if vocabulary is None:
+            vocabulary = _vocabularies[model] = load_candidate_vocabulary(pipe.tokenizer, model)
+        return vocabulary
+
+
+def batched_fill_mask(pipe, words, top_k=FILL_MASK_TOP_K, batch_size=DEFAULT_BATCH_SIZE, vocabulary=None):
+    """Resolve "The opposite of {word} is [MASK]." for every word in one padded, batched call.
+
+    Returns a dict mapping each distinct word to the pipeline's candidate list, exactly as
+    a per-word `pipe(text, top_k=top_k)` call would return it. With a `CandidateVocabulary`,
+    candidates are limited to its tokens.
+    """
+    words = list(dict.fromkeys(words))
+    if not words:
+        return {}
+    texts = [FILL_MASK_TEMPLATE.format(word) for word in words]
+    metrics.inc("flux_model_queries_total", len(texts), mode="batched")
+    with metrics.timed("flux_model_call_seconds", mode="batched"):
+        if vocabulary is not None:
+            outputs = vocabulary.fill_mask(pipe, texts, top_k=top_k, batch_size=batch_size)
+        else:
+            outputs = pipe(texts, top_k=top_k, batch_size=batch_size)
+            if len(texts) == 1:
+                # The pipeline unwraps single-element inputs
+                outputs = [outputs]
+    return dict(zip(words, outputs))
+
+
+def compare_fill_mask(reference, candidate, words, top_k=FILL_MASK_TOP_K):
+    """Agreement of two fill-mask backends over `words`: top-1 match rate, mean top-k overlap, max score delta."""
+    expected = batched_fill_mask(reference, words, top_k=top_k)
+    actual = batched_fill_mask(candidate, words, top_k=top_k)
+    top1 = overlap = 0.0
+    score_delta = 0.0
+    for word in expected:
+        reference_tokens = [c["token_str"] for c in expected[word]]
+        candidate_scores = {c["token_str"]: c["score"] for c in actual[word]}
+        top1 += reference_tokens[0] == actual[word][0]["token_str"]
+        overlap += len(set(reference_tokens) & set(candidate_scores)) / len(reference_tokens)
+        score_delta = max([score_delta] + [abs(c["score"] - candidate_scores[c["token_str"]])
+                                           for c in expected[word] if c["token_str"] in candidate_scores])
+    count = max(len(expected), 1)
+    return {"top1_agreement": top1 / count, "topk_overlap": overlap / count, "max_score_delta": score_delta}
+
+
+# Set FLUX_MODEL_IDLE_SECONDS to unload models that have not been used for that many seconds
+fill_mask_registry = FillMaskRegistry(idle_seconds=float(os.environ.get(MODEL_IDLE_ENV) or 0))
@@ -0,0 +1,122 @@
+# flux_onnx.py
+#
+# ONNX Runtime fill-mask backend. The model is exported from its transformers checkpoint
+# once, optionally int8-quantized, and cached under data/onnx/. `OnnxFillMask` returns the
+# same candidate dicts as a transformers fill-mask pipeline, so it can be used in its place.
+import inspect
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+ONNX_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "onnx")
+_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+_export_lock = threading.Lock()
+
+
+def _model_dir(model):
+    return os.path.join(ONNX_CACHE_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "--", model))
+
+
+def export_onnx(model, quantize=False):
+    """Export `model` to ONNX (and an int8 copy when `quantize`) unless already cached; returns the path."""
+    directory = _model_dir(model)
+    fp32_path = os.path.join(directory, "model.onnx")
+    int8_path = os.path.join(directory, "model.int8.onnx")
+    with _export_lock:
+        if not os.path.exists(fp32_path):
+            import torch
+            from transformers import AutoModelForMaskedLM, AutoTokenizer
+
+            logger.info("Exporting %s to ONNX...", model)
+            os.makedirs(directory, exist_ok=True)
+            tokenizer = AutoTokenizer.from_pretrained(model)
+            masked_lm = AutoModelForMaskedLM.from_pretrained(model).eval()
+            sample = tokenizer(["The opposite of good is [MASK]."], return_tensors="pt")
+            names = [name for name in _INPUT_NAMES if name in sample]
+            dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names + ["logits"]}
+            tmp_path = f"{fp32_path}.tmp{os.getpid()}"
+            # Newer torch defaults to the dynamo exporter, which needs onnxscript; the TorchScript one suffices
+            legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+            with torch.no_grad():
+                torch.onnx.export(masked_lm, (sample["input_ids"], {name: sample[name] for name in names[1:]}),
+                                  tmp_path, input_names=names, output_names=["logits"],
+                                  dynamic_axes=dynamic_axes, opset_version=14, **legacy)
+            os.replace(tmp_path, fp32_path)
+            tokenizer.save_pretrained(directory)
+        if quantize and not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info("Quantizing %s to int8...", model)
+            tmp_path = f"{int8_path}.tmp{os.getpid()}.onnx"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+    return int8_path if quantize else fp32_path
+
+
+class OnnxFillMask:
+    """Drop-in replacement for a transformers fill-mask pipeline backed by an ONNX Runtime session."""
+
+    def __init__(self, model, device=-1, quantize=False):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        path = export_onnx(model, quantize=quantize)
+        self.model_name = model
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(path))
+        providers = ["CPUExecutionProvider"]
+        if device is not None and device >= 0 and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            providers.insert(0, ("CUDAExecutionProvider", {"device_id": device}))
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=providers)
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _mask_logits(self, texts, batch_size):
+        """Yield (input_ids, mask positions, logits at the masks) for each padded batch of `texts`."""
+        import numpy as np
+
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True, return_tensors="np")
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(["logits"], feeds)[0]
+            rows, positions = np.nonzero(encoded["input_ids"] == self.tokenizer.mask_token_id)
+            yield encoded["input_ids"], positions, logits[rows, positions].astype(np.float64)
+
+    def __call__(self, inputs, top_k=5, batch_size=None):
+        import numpy as np
+
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        outputs = []
+        for input_ids, positions, mask_logits in self._mask_logits(texts, batch_size or len(texts)):
+            probabilities = np.exp(mask_logits - mask_logits.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            for ids, position, row in zip(input_ids, positions, probabilities):
+                top = np.argpartition(-row, top_k)[:top_k]
+                top = top[np.argsort(-row[top], kind="stable")]
+                candidates = []
+                for token in top.tolist():
+                    filled = ids.copy()
+                    filled[position] = token
+                    candidates.append({
+                        "score": float(row[token]),
+                        "token": token,
+                        "token_str": self.tokenizer.decode([token]),
+                        "sequence": self.tokenizer.decode(filled, skip_special_tokens=True),
+                    })
+                outputs.append(candidates)
+        # Like the transformers pipeline, a single input returns its candidates unwrapped
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def gather_scores(self, texts, token_ids, batch_size=None):
+        """Full-vocabulary probabilities of `token_ids` at the mask of each text, as an (n, len(token_ids)) array."""
+        import numpy as np
+
+        chunks = []
+        for _, _, mask_logits in self._mask_logits(texts, batch_size or len(texts)):
+            peak = mask_logits.max(axis=1, keepdims=True)
+            log_norm = peak + np.log(np.exp(mask_logits - peak).sum(axis=1, keepdims=True))
+            chunks.append(np.exp(mask_logits[:, token_ids] - log_norm))
+        return np.concatenate(chunks)
@@ -0,0 +1,164 @@
+# flux_sentiment.py
+#
+# Lexicon sentiment scorer. data/sentiment_lexicon.tsv is compiled from TextBlob's (pattern's)
+# en-sentiment.xml, which is public domain (PDDL), and seeded with strength_map. Scoring follows
+# pattern's algorithm (intensifiers, negation, "!") in a single pass over the prompt's tokens,
+# so TextBlob is not needed at run time. Recompile the lexicon with
+#
+#     python flux_sentiment.py path/to/textblob/en/en-sentiment.xml
+import logging
+import os
+import threading
+
+try:
+    from .flux_utils import phrase_tokens, strength_map
+except ImportError:  # run as a script
+    from flux_utils import phrase_tokens, strength_map
+
+logger = logging.getLogger(__name__)
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sentiment_lexicon.tsv")
+NEGATIONS = frozenset(("no", "not", "n't", "never"))
+
+
+def sentiment_tokens(text):
+    """Lowercased tokens of `text`, with "n't" split off so "isn't great" is negated.
+
+    (TextBlob's tokenizer breaks "n't" into "n ' t", so it never negates contractions.)
+    """
+    return split_contractions(phrase_tokens(text.lower()))
+
+
+def split_contractions(tokens):
+    """`sentiment_tokens` for already tokenised, lowercased text."""
+    result = []
+    for token in tokens:
+        if token.endswith("n't") and len(token) > 3:
+            result.append(token[:-3])
+            result.append("n't")
+        else:
+            result.append(token)
+    return result
+
+
+def compile_lexicon(xml_path, path=LEXICON_PATH, seeds=strength_map):
+    """Compile pattern's en-sentiment.xml into word, polarity, intensity, modifier rows, plus `seeds`.
+
+    Per-sense scores are averaged exactly as pattern does, including its derived "-ly" adverbs.
+    Single-word negative descriptors in `seeds` (strength above the neutral 0.5, not "-ly"
+    adverbs) that the XML lacks, such as "blurry", are added with polarity 1 - 2 * strength.
+    """
+    from xml.etree import ElementTree
+
+    def avg(values):
+        return sum(values) / len(values)
+
+    senses = {}
+    for node in ElementTree.parse(xml_path).getroot().findall("word"):
+        form = node.attrib.get("form")
+        if form:
+            psi = (float(node.attrib.get("polarity", 0.0)), float(node.attrib.get("subjectivity", 0.0)),
+                   float(node.attrib.get("intensity", 1.0)))
+            senses.setdefault(form, {}).setdefault(node.attrib.get("pos"), []).append(psi)
+    words = {}
+    for form, by_pos in senses.items():
+        words[form] = {pos: [avg(column) for column in zip(*psi)] for pos, psi in by_pos.items()}
+        words[form][None] = [avg(column) for column in zip(*words[form].values())]
+    # pattern maps "terrible" to the adverb "terribly"
+    for form, by_pos in list(words.items()):
+        if "JJ" in by_pos:
+            stem = form[:-1] + "i" if form.endswith("y") else form
+            stem = stem[:-2] if stem.endswith("le") else stem
+            adverb = words.setdefault(stem + "ly", {})
+            adverb["RB"] = adverb[None] = by_pos["JJ"]
+
+    rows = {form: (by_pos[None][0], by_pos[None][2], "RB" in by_pos) for form, by_pos in words.items()}
+    for word, strength in seeds.items():
+        if (word not in rows and word not in NEGATIONS and strength > 0.5 and " " not in word
+                and not word.endswith("ly")):
+            rows[word] = (round(1.0 - 2.0 * strength, 4), 1.0, False)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("# word\tpolarity\tintensity\tmodifier (compiled by flux_sentiment.py)\n")
+        for word in sorted(rows):
+            polarity, intensity, modifier = rows[word]
+            f.write(f"{word}\t{polarity!r}\t{intensity!r}\t{int(modifier)}\n")
+    os.replace(tmp_path, path)
+    logger.info("Sentiment lexicon written to %s (%s words)", path, len(rows))
+    return path
+
+
+class SentimentLexicon:
+    """Polarity lexicon loaded on first use into a flat {word: (polarity, intensity, is_modifier)} dict."""
+
+    def __init__(self, path=LEXICON_PATH):
+        self.path = path
+        self._words = None
+        self._lock = threading.Lock()
+
+    @property
+    def words(self):
+        if self._words is None:
+            with self._lock:
+                if self._words is None:
+                    words = {}
+                    with open(self.path, encoding="utf-8") as f:
+                        for line in f:
+                            if not line.startswith("#"):
+                                word, polarity, intensity, modifier = line.rstrip("\r\n").split("\t")
+                                words[word] = (float(polarity), float(intensity), modifier == "1")
+                    self._words = words
+        return self._words
+
+    def score_tokens(self, tokens):
+        """Polarity in [-1, 1] of lowercased `tokens`, the mean over their assessed words."""
+        words = self.words
+        assessments = []  # [polarity, intensity, negated] per known word with its modifiers
+        modifier = None
+        negation = None
+        for token in tokens:
+            entry = words.get(token)
+            if entry is not None:
+                polarity, intensity, is_modifier = entry
+                if modifier is None:
+                    assessments.append([polarity, intensity, False])
+                else:  # "very good": the preceding modifier scales this word
+                    previous = assessments[-1]
+                    previous[0] = max(-1.0, min(polarity * previous[1], 1.0))
+                    previous[1] = intensity
+                if negation is not None:
+                    assessments[-1][1] = 1.0 / assessments[-1][1]
+                    assessments[-1][2] = True
+                modifier = token if is_modifier else None
+                negation = token if token in NEGATIONS else None
+            else:
+                if token in NEGATIONS:
+                    negation = token
+                elif negation and len(token.strip("'")) > 1:
+                    negation = None
+                if negation is not None and modifier is not None and modifier.endswith("ly"):
+                    assessments[-1][2] = True
+                    negation = None
+                elif modifier and len(token) > 2:
+                    modifier = None
+                if token == "!" and assessments:
+                    assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, 1.0))
+        if not assessments:
+            return 0.0
+        # "not good" is slightly bad, "not bad" slightly good
+        return sum(polarity * -0.5 if negated else polarity for polarity, _, negated in assessments) / len(assessments)
+
+    def score(self, text):
+        return self.score_tokens(sentiment_tokens(text))
+
+
+sentiment_lexicon = SentimentLexicon()
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python flux_sentiment.py <en-sentiment.xml> [output.tsv]")
+    compile_lexicon(*sys.argv[1:])
@@ -0,0 +1,181 @@
+# flux_server.py
+#
+# Local HTTP service around one warm FluxPseudoNegativeEngine, so scripts can convert prompts
+# without ComfyUI or reloading BERT and WordNet each time. Start it with
+#
+#     python flux_cli.py serve --port 8765
+#
+#     POST /convert  {"negative_prompt": ..., "positive_prompt": ..., "complexity": ...}
+#                    -> {"modified_prompt": ..., "llm_input": ...}
+#     POST /convert  {"prompts": [{"negative_prompt": ...}, ...], "complexity": ...}
+#                    -> {"results": [{"modified_prompt": ..., "llm_input": ...}, ...]}
+#     GET  /health   -> {"status": "ok", ...}
+#
+# Options are the node's inputs (RUN_OPTIONS); a prompt's own options override the request's,
+# which override the server's defaults.
+# Requests arriving within a few milliseconds of each other are converted in one batch, and
+# connections are kept alive between requests.
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .flux_engine import FluxPseudoNegativeEngine, RUN_OPTIONS, data_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_WINDOW_S = 0.005  # how long the first request of a batch waits for others to join it
+MAX_BATCH_RECORDS = 256
+MAX_REQUEST_BYTES = 16 * 2**20
+
+
+class RequestBatcher:
+    """Collects concurrently submitted requests and converts them together on one thread."""
+
+    def __init__(self, engine, defaults=None, window=BATCH_WINDOW_S, max_records=MAX_BATCH_RECORDS):
+        self.engine = engine
+        self.defaults = defaults or {}
+        self.window = window
+        self.max_records = max_records
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="flux-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, records, options):
+        """Queue `records` with request-level `options`; the Future resolves to their (modified_prompt, llm_input)."""
+        future = Future()
+        self._queue.put(([{**self.defaults, **options, **record} for record in records], future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            count = len(item[0])
+            deadline = time.monotonic() + self.window
+            while count < self.max_records:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # stop after this batch
+                    break
+                batch.append(item)
+                count += len(item[0])
+            self._convert(batch)
+
+    def _convert(self, batch):
+        try:
+            outputs = self.engine.convert_records([record for records, _ in batch for record in records])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # Convert the requests separately so only the invalid one fails
+            for item in batch:
+                self._convert([item])
+            return
+        position = 0
+        for records, future in batch:
+            future.set_result(outputs[position:position + len(records)])
+            position += len(records)
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    server_version = "FluxPseudoNegative"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        engine = self.server.engine
+        self._send(200, {"status": "ok", "fill_mask_model": engine.fill_mask_model,
+                         "data_version": data_version(), "last_run": engine.last_run_summary})
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        header = self.headers.get("Content-Length", "0").strip()
+        if not (header.isascii() and header.isdigit()):
+            # The body cannot be delimited, so the connection cannot be reused
+            self.close_connection = True
+            self._send(400, {"error": f"Invalid Content-Length {header!r}"})
+            return
+        length = int(header)
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Expected a JSON object")
+            single = "prompts" not in body
+            records = [body] if single else body["prompts"]
+            if not isinstance(records, list):
+                raise ValueError("prompts must be a list")
+            unknown = set() if single else set(body) - set(RUN_OPTIONS) - {"prompts"}
+            if unknown:
+                raise ValueError(f"Unknown request keys: {', '.join(sorted(unknown))}")
+            options = {name: body[name] for name in RUN_OPTIONS if name in body}
+            outputs = self.server.batcher.submit(records, options).result()
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            logger.exception("Conversion failed")
+            self._send(500, {"error": str(e)})
+            return
+        results = [{"modified_prompt": result, "llm_input": llm_input} for result, llm_input in outputs]
+        self._send(200, results[0] if single else {"results": results})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """HTTP server sharing one engine and request batcher between all connections."""
+    daemon_threads = True
+
+    def __init__(self, engine=None, host=DEFAULT_HOST, port=DEFAULT_PORT, defaults=None, window=BATCH_WINDOW_S):
+        super().__init__((host, port), ConversionHandler)
+        self.engine = engine if engine is not None else FluxPseudoNegativeEngine()
+        self.batcher = RequestBatcher(self.engine, defaults, window)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def serve(engine=None, host=DEFAULT_HOST, port=DEFAULT_PORT, defaults=None, window=BATCH_WINDOW_S):
+    """Run a ConversionServer until interrupted; `defaults` are options for requests that do not set them."""
+    server = ConversionServer(engine, host, port, defaults, window)
+    logger.info("Serving prompt conversion on http://%s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,111 @@
+# flux_tables.py
+import mmap
+import os
+import struct
+
+# Memory-mapped, read-only string table with O(1) lookups.
+#
+# Layout (little endian):
+#   header   magic "FPNT", version u16, fields u16, records u32, buckets u32
+#   buckets  u32 * buckets       record index + 1, 0 when empty (open addressing, linear probing)
+#   offsets  u32 * (records + 1) byte offsets of each record in the string pool
+#   pool     UTF-8 records "key\x1ffield\x1ffield...", sorted by key
+#
+# Tables are built once and mapped read-only, so every process that opens the same
+# file shares one page-cached copy.
+
+MAGIC = b"FPNT"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_SEPARATOR = "\x1f"
+
+
+def _hash(data):
+    """64-bit FNV-1a; stable across processes, unlike the builtin hash()."""
+    h = 0xcbf29ce484222325
+    for byte in data:
+        h = ((h ^ byte) * 0x100000001b3) & 0xFFFFFFFFFFFFFFFF
+    return h
+
+
+def build_table(path, records, fields):
+    """Write `records` ({key: (field, ...)}) to `path` as a string table with `fields` values per key."""
+    keys = sorted(records)
+    pool = bytearray()
+    offsets = []
+    for key in keys:
+        values = records[key]
+        if len(values) != fields:
+            raise ValueError(f"Record {key!r} has {len(values)} fields, expected {fields}")
+        if any(_SEPARATOR in str(part) for part in (key,) + tuple(values)):
+            raise ValueError(f"Record {key!r} contains the reserved separator character")
+        offsets.append(len(pool))
+        pool += _SEPARATOR.join((key,) + tuple(str(v) for v in values)).encode("utf-8")
+    offsets.append(len(pool))
+
+    bucket_count = max(8, len(keys) * 2)
+    buckets = [0] * bucket_count
+    for index, key in enumerate(keys):
+        slot = _hash(key.encode("utf-8")) % bucket_count
+        while buckets[slot]:
+            slot = (slot + 1) % bucket_count
+        buckets[slot] = index + 1
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, fields, len(keys), bucket_count))
+        f.write(struct.pack(f"<{bucket_count}I", *buckets))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(pool)
+    os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial table
+
+
+class StringTable:
+    """Read-only view over a table written by `build_table`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.fields, self._records, self._buckets = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} string table")
+        self._bucket_offset = _HEADER.size
+        self._offsets_offset = self._bucket_offset + 4 * self._buckets
+        self._pool_offset = self._offsets_offset + 4 * (self._records + 1)
+
+    def __len__(self):
+        return self._records
+
+    def _record(self, index):
+        start, end = struct.unpack_from("<II", self._map, self._offsets_offset + 4 * index)
+        return self._map[self._pool_offset + start:self._pool_offset + end].decode("utf-8").split(_SEPARATOR)
+
+    def get(self, key, default=None):
+        """Return the field tuple stored for `key`, or `default`."""
+        if not self._records:
+            return default
+        encoded = key.encode("utf-8")
+        prefix = encoded + _SEPARATOR.encode("utf-8")
+        slot = _hash(encoded) % self._buckets
+        while True:
+            index = struct.unpack_from("<I", self._map, self._bucket_offset + 4 * slot)[0]
+            if not index:
+                return default
+            start = struct.unpack_from("<I", self._map, self._offsets_offset + 4 * (index - 1))[0]
+            position = self._pool_offset + start
+            if self._map[position:position + len(prefix)] == prefix:
+                return tuple(self._record(index - 1)[1:])
+            slot = (slot + 1) % self._buckets
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def items(self):
+        """Iterate (key, fields) pairs in sorted key order."""
+        for index in range(self._records):
+            record = self._record(index)
+            yield record[0], tuple(record[1:])
+
+    def close(self):
+        self._map.close()
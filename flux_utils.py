@@ -1,247 +1,378 @@
 # flux_utils.py
-from nltk import ngrams, word_tokenize
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+
+try:
+    from .flux_builtins import phrase_map as builtin_phrases, strength_map
+except ImportError:  # imported by a module run as a script
+    from flux_builtins import phrase_map as builtin_phrases, strength_map
+
+logger = logging.getLogger(__name__)
+
+# NLTK data packages used by the node, as (download name, nltk.data path).
+# They are only looked up locally; run `python install.py` to fetch them.
+NLTK_RESOURCES = {
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "wordnet": "corpora/wordnet",
+}
+_checked_resources = set()
+CACHE_DIR_ENV = "FLUX_CACHE_DIR"
+
+
+def require_nltk_resource(name):
+    """Check that an NLTK data package is installed locally, without touching the network."""
+    if name in _checked_resources:
+        return
+    import nltk
+    try:
+        nltk.data.find(NLTK_RESOURCES[name])
+    except LookupError:
+        try:
+            nltk.data.find(f"{NLTK_RESOURCES[name]}.zip")
+        except LookupError:
+            raise LookupError(f"NLTK resource '{name}' is not installed. "
+                              f"Run `python install.py` in the FluxPseudoNegative node directory.") from None
+    _checked_resources.add(name)
+
+
+def install_nltk_resources():
+    import nltk
+    for name in NLTK_RESOURCES:
+        nltk.download(name, quiet=True)
+
+
+def user_cache_dir(*parts):
+    """Directory for data compiled at run time: FLUX_CACHE_DIR, or flux_pseudo_negative in the user's cache directory.
+
+    The node's own data directory is only written by install.py, so read-only installs keep working.
+    """
+    base = os.environ.get(CACHE_DIR_ENV)
+    if not base:
+        if os.name == "nt":
+            root = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        else:
+            root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(root, "flux_pseudo_negative")
+    return os.path.join(base, *parts)
+
+
+def pos_tag(words):
+    require_nltk_resource("averaged_perceptron_tagger")
+    from nltk import pos_tag as nltk_pos_tag
+    return nltk_pos_tag(words)
+
+
+def pos_tag_sents(sentences):
+    require_nltk_resource("averaged_perceptron_tagger")
+    from nltk import pos_tag_sents as nltk_pos_tag_sents
+    return nltk_pos_tag_sents(sentences)
+
+
+# Numbers (kept whole, so a `(tag:1.4)` weight stays one token), words (letters, digits, inner
+# hyphens/apostrophes) or single punctuation marks
+_TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)?|[\w'-]+|[^\w\s]")
+_EMPHASIS_PATTERN = re.compile(r"\(\s*([^()]*[^()\s])\s*:\s*(\d+(?:\.\d+)?)\s*\)")
+_PHRASE_END = None  # trie key marking a complete phrase
+
+
+class StageTimer:
+    """Accumulates wall time per named pipeline stage."""
 
-class PhraseHandler:
     def __init__(self):
-        self.phrase_map = {
-            # Quality and resolution
-            "low quality": "high quality",
-            "bad quality": "excellent quality",
-            "poor quality": "superior quality",
-            "low resolution": "high resolution",
-            "blurry image": "sharp image",
-            "pixelated": "smooth",
-            "grainy": "clear",
-            "noisy": "clean",
-            "artifacted": "artifact-free",
-            "compressed": "uncompressed",
-            "lossy": "lossless",
-
-            # Composition and framing
-            "bad composition": "well-composed",
-            "poor framing": "well-framed",
-            "unbalanced composition": "balanced composition",
-            "cluttered composition": "clean composition",
-            "awkward pose": "natural pose",
-            "stiff pose": "relaxed pose",
-
-            # Lighting and exposure
-            "poorly lit": "well lit",
-            "bad lighting": "excellent lighting",
-            "harsh lighting": "soft lighting",
-            "flat lighting": "dynamic lighting",
-            "overexposed": "well-exposed",
-            "underexposed": "properly exposed",
-            "blown out highlights": "well-preserved highlights",
-            "crushed shadows": "detailed shadows",
-
-            # Color and contrast
-            "washed out colors": "vibrant colors",
-            "dull colors": "rich colors",
-            "oversaturated": "naturally saturated",
-            "desaturated": "colorful",
-            "low contrast": "high contrast",
-            "flat contrast": "dynamic contrast",
-            "monochromatic": "colorful",
-
-            # Focus and depth
-            "out of focus": "in focus",
-            "shallow depth of field": "deep depth of field",
-            "flat image": "image with depth",
-
-            # Style and aesthetics
-            "ugly": "beautiful",
-            "unattractive": "attractive",
-            "plain": "visually interesting",
-            "boring": "engaging",
-            "generic": "unique",
-            "amateur": "professional",
-            "amateurish": "skillful",
-            "unprofessional": "professional",
-            "kitsch": "refined",
-            "tacky": "elegant",
-            "gaudy": "tasteful",
-
-            # Artistic techniques
-            "poorly drawn": "well drawn",
-            "badly sketched": "skillfully sketched",
-            "amateurish painting": "masterful painting",
-            "rough brushstrokes": "refined brushstrokes",
-            "sloppy linework": "precise linework",
-            "unrefined": "polished",
-
-            # Perspective and proportion
-            "bad perspective": "correct perspective",
-            "wonky perspective": "accurate perspective",
-            "distorted proportions": "correct proportions",
-            "unrealistic scale": "realistic scale",
-
-            # Anatomy and figure
-            "bad anatomy": "accurate anatomy",
-            "incorrect anatomy": "correct anatomy",
-            "deformed": "well-formed",
-            "disproportionate": "proportionate",
-            "asymmetrical face": "symmetrical face",
-            "unnatural pose": "natural pose",
-
-            # Texture and detail
-            "lack of detail": "rich in detail",
-            "over-simplified": "detailed",
-            "flat textures": "realistic textures",
-            "unrealistic skin": "lifelike skin",
-            "plastic-looking": "natural-looking",
-
-            # Environmental elements
-            "dull background": "interesting background",
-            "distracting background": "complementary background",
-            "inconsistent lighting": "consistent lighting",
-            "unrealistic shadows": "realistic shadows",
-            "lack of atmosphere": "atmospheric",
-
-            # Camera and lens effects
-            "lens distortion": "undistorted",
-            "chromatic aberration": "no chromatic aberration",
-            "vignetting": "even exposure",
-            "motion blur": "sharp and clear",
-
-            # Digital artifacts
-            "jpeg artifacts": "artifact-free",
-            "banding": "smooth gradients",
-            "moire patterns": "clean patterns",
-
-            # Style-specific
-            "uncanny valley": "photorealistic",
-            "too cartoonish": "realistic",
-            "overly stylized": "naturally styled",
-
-            # Miscellaneous
-            "unfinished": "complete",
-            "rough draft": "polished final version",
-            "lazy execution": "meticulously crafted",
-            "uninspired": "creative",
-            "derivative": "original",
-            "cliché": "innovative",
-            "inconsistent style": "consistent style",
-            "mismatched elements": "harmonious elements",
-            "poor use of space": "effective use of space",
-            "lack of focal point": "clear focal point",
-            "confusing layout": "intuitive layout",
-            "jarring color scheme": "pleasing color scheme",
-            "inappropriate tone": "appropriate tone",
-            "lack of emotion": "emotionally evocative",
-            "stiff": "dynamic",
-            "lifeless": "vibrant",
-            "fake-looking": "authentic-looking",
-            "cheap-looking": "premium-looking",
-            "dated": "timeless",
-            "forgettable": "memorable",
-        }
-        print(f"Phrase map initialized with {len(self.phrase_map)} entries")
+        self.seconds = {}
+        self._started = time.perf_counter()
+        self._last = self._started
+
+    def stop(self, stage):
+        """Attribute the time since the previous stop (or construction) to `stage`."""
+        now = time.perf_counter()
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def total(self):
+        return time.perf_counter() - self._started
+
+    def as_milliseconds(self):
+        return {stage: round(seconds * 1000, 3) for stage, seconds in self.seconds.items()}
+
+
+def phrase_tokens(text):
+    return _TOKEN_PATTERN.findall(text)
+
+
+class PromptTokens:
+    """A prompt tokenised once: token i is tokens[i] and spans text[starts[i]:ends[i]].
+
+    Phrase matching, tag splitting, POS tagging and sentiment scoring all read these, so a
+    prompt goes through the tokenizer once per run. Tokens cover every non-space character,
+    so the text between two consecutive tokens is always whitespace, possibly empty.
+    """
+    __slots__ = ("text", "tokens", "starts", "ends")
+
+    def __init__(self, text, tokens=None, starts=None, ends=None):
+        self.text = text
+        if tokens is None:
+            tokens, starts, ends = [], array("I"), array("I")
+            for match in _TOKEN_PATTERN.finditer(text):
+                tokens.append(match.group())
+                starts.append(match.start())
+                ends.append(match.end())
+        self.tokens = tokens
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def tags(self):
+        """(tag, tokens) for each non-empty tag of `text.split(",")`, with surrounding whitespace stripped."""
+        tags = []
+        first = 0
+        count = len(self.tokens)
+        for i in range(count + 1):
+            if i == count or self.tokens[i] == ",":
+                if i > first:
+                    tags.append((self.text[self.starts[first]:self.ends[i - 1]], self.tokens[first:i]))
+                first = i + 1
+        return tags
+
+
+class TagAnalysis:
+    """Words and POS tags of a run's tags, in flat arrays.
+
+    Built from a {tag: tokens} mapping taken from the prompts' `PromptTokens`, so tags are not
+    tokenised again. Tag i owns words[offsets[i]:offsets[i + 1]]. Only multi-word tags are
+    POS-tagged, all of them in one batched call; the cascade never needs the part of speech
+    of a single word.
+    """
+    __slots__ = ("index", "words", "pos", "offsets")
+
+    def __init__(self, tag_tokens):
+        self.index = {}
+        self.words = []
+        self.offsets = array("I", [0])
+        for tag, tokens in tag_tokens.items():
+            self.index[tag] = len(self.index)
+            self.words.extend(tokens)
+            self.offsets.append(len(self.words))
+        self.pos = [None] * len(self.words)
+        multi_word = [i for i in range(len(self.index)) if self.offsets[i + 1] - self.offsets[i] > 1]
+        if multi_word:
+            tagged = pos_tag_sents([self.words[self.offsets[i]:self.offsets[i + 1]] for i in multi_word])
+            for i, pairs in zip(multi_word, tagged):
+                self.pos[self.offsets[i]:self.offsets[i + 1]] = [pos for _, pos in pairs]
+
+    def __contains__(self, tag):
+        return tag in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def tag_words(self, tag):
+        i = self.index[tag]
+        return self.words[self.offsets[i]:self.offsets[i + 1]]
+
+    def tagged_words(self, tag):
+        """(word, POS) pairs of a multi-word tag, as `pos_tag` returns them."""
+        i = self.index[tag]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return list(zip(self.words[start:end], self.pos[start:end]))
+
+
+_builtin_trie = None
+_builtin_trie_lock = threading.Lock()
+
+
+def builtin_phrase_trie():
+    """Token trie of the built-in phrase map, built once per process and shared by every PhraseHandler."""
+    global _builtin_trie
+    if _builtin_trie is None:
+        with _builtin_trie_lock:
+            if _builtin_trie is None:
+                trie = {}
+                for phrase in builtin_phrases:
+                    _insert_phrase(trie, phrase)
+                _builtin_trie = trie
+    return _builtin_trie
+
+
+def _insert_phrase(trie, phrase):
+    node = trie
+    for token in phrase_tokens(phrase):
+        node = node.setdefault(token, {})
+    node[_PHRASE_END] = phrase
+
+
+class PhraseHandler:
+    """Leftmost-longest phrase replacement over layers of (token trie, phrase map).
+
+    The built-in layer comes first and each `add_phrases` call adds a layer on top; a phrase
+    in a later layer overrides the same phrase below it. Layers are shared, never copied, so
+    a handler built on `base` only pays for the phrases it adds.
+    """
+
+    def __init__(self, extra_phrases=None, base=None):
+        self.layers = list(base.layers) if base is not None else [(builtin_phrase_trie(), builtin_phrases)]
+        if extra_phrases:
+            self.add_phrases(extra_phrases)
+        logger.debug("Phrase map initialized with %s layers", len(self.layers))
+
+    @property
+    def phrase_map(self):
+        """Every phrase and its replacement, later layers winning."""
+        if len(self.layers) == 1:
+            return self.layers[0][1]
+        merged = {}
+        for _, phrases in self.layers:
+            merged.update(phrases)
+        return merged
+
+    def add_phrases(self, phrases):
+        """Add or override phrase mappings, e.g. from a user dictionary."""
+        trie = {}
+        phrases = dict(phrases)
+        for phrase in phrases:
+            _insert_phrase(trie, phrase)
+        self.layers.append((trie, phrases))
+
+    def token_matches(self, prompt):
+        """Yield (first, end, phrase, replacement) for leftmost-longest, non-overlapping matches in `prompt`.
+
+        Matching walks the layers' token tries together from each token, so it is linear in the
+        prompt length and independent of the size of the phrase maps. Phrases only match whole
+        tokens, and consecutive tokens must be separated by whitespace only.
+        """
+        tokens, starts, ends = prompt.tokens, prompt.starts, prompt.ends
+        i = 0
+        while i < len(tokens):
+            nodes = self.layers
+            match = None
+            j = i
+            while j < len(tokens):
+                if j > i and starts[j] == ends[j - 1]:
+                    break
+                following = []
+                for node, phrases in nodes:
+                    child = node.get(tokens[j])
+                    if child is not None:
+                        following.append((child, phrases))
+                nodes = following
+                if not nodes:
+                    break
+                j += 1
+                for node, phrases in reversed(nodes):
+                    if _PHRASE_END in node:
+                        phrase = node[_PHRASE_END]
+                        match = (j, phrase, phrases[phrase])
+                        break
+            if match:
+                end, phrase, replacement = match
+                yield i, end, phrase, replacement
+                i = end
+            else:
+                i += 1
+
+    def iter_matches(self, text):
+        """Yield (start, end, phrase) character ranges of the phrase matches in `text`."""
+        prompt = PromptTokens(text)
+        for first, end, phrase, _ in self.token_matches(prompt):
+            yield prompt.starts[first], prompt.ends[end - 1], phrase
 
     def find_phrases(self, text):
-        print(f"Finding phrases in text: {text}")
-        tokens = word_tokenize(text)
-        found_phrases = []
-        for n in range(4, 0, -1):
-            for gram in ngrams(tokens, n):
-                phrase = " ".join(gram)
-                if phrase in self.phrase_map:
-                    found_phrases.append(phrase)
-        print(f"Found phrases: {found_phrases}")
+        logger.debug("Finding phrases in text: %s", text)
+        found_phrases = list(dict.fromkeys(phrase for _, _, phrase in self.iter_matches(text)))
+        logger.debug("Found phrases: %s", found_phrases)
         return found_phrases
 
     def replace_phrases(self, text):
-        print(f"Replacing phrases in text: {text}")
-        phrases = self.find_phrases(text)
+        processed, handled_tags, replacements = self.replace_phrase_tokens(PromptTokens(text))
+        return processed.text, handled_tags, replacements
+
+    def replace_phrase_tokens(self, prompt):
+        """`replace_phrases` for a tokenised prompt; returns the replaced prompt's `PromptTokens`.
+
+        Tokens outside the matches are carried over with shifted spans, so only the
+        replacement texts are tokenised.
+        """
+        logger.debug("Replacing phrases in text: %s", prompt.text)
+        text = prompt.text
         handled_tags = set()
         replacements = {}
-        for phrase in phrases:
-            if phrase in text:
-                replacement = self.phrase_map[phrase]
-                text = text.replace(phrase, replacement)
-                handled_tags.add(phrase)
-                replacements[phrase] = replacement
-        print(f"Text after phrase replacement: {text}")
-        return text, handled_tags, replacements
-
-strength_map = {
-    # Extreme negatives
-    "terrible": 1.0, "horrible": 0.98, "awful": 0.96, "dreadful": 0.94, "atrocious": 0.92,
-    "abysmal": 0.90, "appalling": 0.88, "catastrophic": 0.86, "disastrous": 0.84,
-    
-    # Strong negatives
-    "very bad": 0.82, "awful": 0.80, "poor": 0.78, "subpar": 0.76, "inferior": 0.74,
-    "inadequate": 0.72, "unacceptable": 0.70, "disappointing": 0.68, "unsatisfactory": 0.66,
-    
-    # Moderate negatives
-    "bad": 0.64, "flawed": 0.62, "deficient": 0.60, "problematic": 0.58, "questionable": 0.56,
-    "lackluster": 0.54, "mediocre": 0.52, "so-so": 0.50, "average": 0.48,
-    
-    # Slight negatives
-    "not great": 0.46, "unremarkable": 0.44, "ordinary": 0.42, "passable": 0.40, "tolerable": 0.38,
-    
-    # Neutral
-    "okay": 0.36, "fair": 0.34, "decent": 0.32, "satisfactory": 0.30, "sufficient": 0.28,
-    
-    # Slight positives
-    "rather good": 0.26, "pretty good": 0.24, "quite good": 0.22, "above average": 0.20,
-    
-    # Moderate positives
-    "good": 0.18, "pleasing": 0.16, "quality": 0.14, "fine": 0.12, "commendable": 0.10,
-    
-    # Strong positives
-    "very good": 0.08, "great": 0.06, "excellent": 0.04, "superb": 0.02, "outstanding": 0.00,
-    
-    # Extreme positives
-    "perfect": 0.00, "flawless": 0.00, "impeccable": 0.00, "ideal": 0.00, "sublime": 0.00,
-    
-    # Frequency adverbs
-    "never": 1.0, "rarely": 0.8, "seldom": 0.7, "occasionally": 0.6, "sometimes": 0.5,
-    "often": 0.3, "usually": 0.2, "always": 0.0,
-    
-    # Quantity adjectives
-    "no": 1.0, "few": 0.8, "some": 0.5, "many": 0.3, "most": 0.1, "all": 0.0,
-    
-    # Intensity adverbs
-    "extremely": 0.9, "very": 0.7, "quite": 0.5, "fairly": 0.3, "slightly": 0.1,
-    
-    # Size and scale
-    "tiny": 0.9, "small": 0.7, "medium": 0.5, "large": 0.3, "huge": 0.1,
-    
-    # Quality descriptors
-    "low-quality": 0.8, "high-quality": 0.2, "inferior": 0.7, "superior": 0.3,
-    "substandard": 0.75, "standard": 0.5, "premium": 0.25,
-    
-    # Completeness
-    "incomplete": 0.8, "partial": 0.6, "mostly": 0.4, "nearly": 0.2, "complete": 0.0,
-    
-    # Clarity and focus
-    "blurry": 0.8, "unclear": 0.7, "clear": 0.3, "sharp": 0.2, "crystal-clear": 0.1,
-    
-    # Composition
-    "unbalanced": 0.7, "balanced": 0.3, "harmonious": 0.2,
-    
-    # Lighting
-    "dark": 0.7, "dim": 0.6, "well-lit": 0.3, "bright": 0.2,
-    
-    # Color
-    "monochrome": 0.6, "dull": 0.7, "vibrant": 0.3, "colorful": 0.2,
-    
-    # Texture
-    "rough": 0.6, "smooth": 0.4, "silky": 0.2,
-    
-    # Style
-    "plain": 0.6, "ordinary": 0.5, "stylish": 0.3, "elegant": 0.2,
-    
-    # Originality
-    "cliche": 0.7, "unoriginal": 0.6, "original": 0.3, "innovative": 0.2,
-    
-    # Emotional impact
-    "boring": 0.7, "interesting": 0.3, "captivating": 0.2, "mesmerizing": 0.1,
-    
-    # Skill level
-    "amateurish": 0.8, "unprofessional": 0.7, "professional": 0.3, "masterful": 0.1,
-    
-    # Overall impression
-    "unappealing": 0.8, "appealing": 0.2, "attractive": 0.1, "stunning": 0.0
-}
\ No newline at end of file
+        pieces = []
+        tokens, starts, ends = [], array("I"), array("I")
+        position = 0
+        copied = 0
+        shift = 0  # offset of the processed text against the original after the last replacement
+        for first, end, phrase, replacement in self.token_matches(prompt):
+            start = prompt.starts[first]
+            tokens.extend(prompt.tokens[copied:first])
+            starts.extend(offset + shift for offset in prompt.starts[copied:first])
+            ends.extend(offset + shift for offset in prompt.ends[copied:first])
+            for match in _TOKEN_PATTERN.finditer(replacement):
+                tokens.append(match.group())
+                starts.append(start + shift + match.start())
+                ends.append(start + shift + match.end())
+            pieces.append(text[position:start])
+            pieces.append(replacement)
+            position = prompt.ends[end - 1]
+            shift += len(replacement) - (position - start)
+            copied = end
+            handled_tags.add(phrase)
+            replacements[phrase] = replacement
+        if not replacements:
+            return prompt, handled_tags, replacements
+        tokens.extend(prompt.tokens[copied:])
+        starts.extend(offset + shift for offset in prompt.starts[copied:])
+        ends.extend(offset + shift for offset in prompt.ends[copied:])
+        pieces.append(text[position:])
+        processed = PromptTokens("".join(pieces), tokens, starts, ends)
+        logger.debug("Text after phrase replacement: %s", processed.text)
+        return processed, handled_tags, replacements
+
+
+DEFAULT_INTENSITY = 0.5  # strength_map's neutral midpoint ("so-so"), used for tags it does not cover
+MAX_WEIGHT_BOOST = 0.5  # the most negative tag at full strength and sentiment is emphasised to 1.5
+
+
+def tag_intensity(tag, intensities=strength_map, words=None):
+    """Strongest strength_map intensity among `tag`, its words and its word pairs.
+
+    `words` are the tag's lowercased tokens, when they are already known.
+    """
+    if words is None:
+        words = phrase_tokens(tag.lower())
+    grams = [tag.lower()] + words + [" ".join(pair) for pair in zip(words, words[1:])]
+    found = [intensities[gram] for gram in grams if gram in intensities]
+    return max(found) if found else DEFAULT_INTENSITY
+
+
+def prompt_weights(intensities, sentiment, strength):
+    """Prompt weights for tags of the given intensities, computed in one vectorised pass.
+
+    Each weight is 1.0 plus a boost proportional to the tag's intensity and the `strength`
+    input, scaled from half to full by the magnitude of the prompt's sentiment.
+    """
+    import numpy as np
+
+    boost = MAX_WEIGHT_BOOST * strength * np.asarray(intensities, dtype=np.float64) * (0.5 + 0.5 * abs(sentiment))
+    return np.round(1.0 + boost, 2).tolist()
+
+
+def split_emphasis(tag, tokens):
+    """(inner tag, its tokens, weight) of a tag written as `(tag:weight)`, or (tag, tokens, None)."""
+    match = _EMPHASIS_PATTERN.fullmatch(tag)
+    if match is None:
+        return tag, tokens, None
+    return match.group(1), tokens[1:-3], float(match.group(2))
+
+
+def weighted_tag(tag, weight):
+    """`tag` in ComfyUI's `(tag:weight)` emphasis syntax, or unchanged for a weight of 1."""
+    if weight == 1.0:
+        return tag
+    escaped = tag.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped}:{weight:g})"
@@ -0,0 +1,167 @@
+# flux_wordnet.py
+#
+# Precompiled WordNet antonym index. install.py builds it once, or run
+#
+#     python flux_wordnet.py [output_path]
+#
+# after which wordnet_strategy/nltk_strategy are answered from the index without
+# loading nltk.corpus.wordnet. The same run writes the adjective/adverb list that the
+# fill-mask candidate vocabulary is built from. The node never builds either at run time.
+import logging
+import os
+import threading
+from collections import Counter
+
+try:
+    from .flux_tables import StringTable, build_table
+    from .flux_utils import require_nltk_resource
+except ImportError:  # run as a script
+    from flux_tables import StringTable, build_table
+    from flux_utils import require_nltk_resource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "wordnet_antonyms.fpnt")
+DEFAULT_MODIFIER_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "modifier_words.txt")
+INDEX_FIELDS = 3  # most common antonym, first antonym, "name:count" list
+
+# Suffixes tried on every antonym-bearing lemma so inflected prompt words ("darker", "blurred")
+# are indexed with exactly what wordnet.synsets() returns for them. Every generated form is
+# checked with synsets() at build time, so generating too many forms is harmless. Together
+# with the "-ies", "-ves" and "-men" forms below they cover each of morphy()'s detachment
+# rules; irregular forms come from WordNet's exception lists. Known gaps, which the live
+# synsets() call resolved and the index does not: morphy's "-ful" compounds ("handsful"),
+# and multi-word input with spaces ("ice cream"), which the strategies never look up.
+_INFLECTIONS = ["s", "es", "ed", "d", "ing", "er", "est", "r", "st"]
+
+
+def antonym_lists(wn, word):
+    """Return (all antonyms, first antonym per lemma) exactly as the live strategies walk them."""
+    antonyms = []
+    firsts = []
+    for syn in wn.synsets(word):
+        for lemma in syn.lemmas():
+            lemma_antonyms = lemma.antonyms()
+            if lemma_antonyms:
+                antonyms.extend(a.name() for a in lemma_antonyms)
+                firsts.append(lemma_antonyms[0].name())
+    return antonyms, firsts
+
+
+def most_common(antonyms):
+    # Ties go to the antonym seen first; the old max(set(...)) broke ties by hash order.
+    return Counter(antonyms).most_common(1)[0][0]
+
+
+def _inflected_forms(lemma):
+    forms = {lemma + suffix for suffix in _INFLECTIONS}
+    if lemma.endswith("e"):
+        forms.add(lemma[:-1] + "ing")
+    if lemma.endswith("y"):
+        forms.update({lemma[:-1] + "ies", lemma[:-1] + "ied", lemma[:-1] + "ier", lemma[:-1] + "iest"})
+    if len(lemma) > 2 and lemma[-1] not in "aeiouwxy" and lemma[-2] in "aeiou":
+        forms.update({lemma + lemma[-1] + suffix for suffix in ("ed", "ing", "er", "est")})
+    if lemma.endswith("f"):
+        forms.add(lemma[:-1] + "ves")
+    if lemma.endswith("man"):
+        forms.add(lemma[:-3] + "men")
+    return forms
+
+
+def build_wordnet_index(path=DEFAULT_INDEX_PATH):
+    """Walk WordNet once and write every word form that has antonyms to a string table."""
+    require_nltk_resource("wordnet")
+    from nltk.corpus import wordnet as wn
+
+    logger.info("Building WordNet antonym index...")
+    records = {}
+
+    def add(word):
+        if word in records:
+            return
+        antonyms, firsts = antonym_lists(wn, word)
+        if antonyms:
+            counts = Counter(antonyms)
+            records[word] = (most_common(antonyms), firsts[0],
+                             ",".join(f"{name}:{count}" for name, count in counts.items()))
+
+    for lemma in wn.all_lemma_names():
+        add(lemma)
+    for lemma in list(records):
+        for form in _inflected_forms(lemma):
+            add(form)
+    for exceptions in wn._exception_map.values():
+        for form in exceptions:
+            add(form)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    build_table(path, records, INDEX_FIELDS)
+    logger.info("WordNet antonym index written to %s (%s entries)", path, len(records))
+    return path
+
+
+def build_modifier_words(path=DEFAULT_MODIFIER_WORDS_PATH):
+    """Write the single-word adjective and adverb lemmas in WordNet to `path`, one per line."""
+    require_nltk_resource("wordnet")
+    from nltk.corpus import wordnet as wn
+
+    words = set()
+    for pos in (wn.ADJ, wn.ADJ_SAT, wn.ADV):
+        words.update(name for name in wn.all_lemma_names(pos) if name.isalpha())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{word}\n" for word in sorted(words))
+    os.replace(tmp_path, path)
+    logger.info("WordNet modifier words written to %s (%s words)", path, len(words))
+    return path
+
+
+def modifier_words(path=DEFAULT_MODIFIER_WORDS_PATH):
+    """The WordNet adjectives and adverbs written by build_modifier_words, the candidates for fill-mask antonyms."""
+    if not os.path.exists(path):
+        raise LookupError(f"WordNet modifier word list {path} is missing. "
+                          f"Run `python install.py` in the FluxPseudoNegative node directory.")
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class WordNetAntonymIndex:
+    """Lazily opened antonym index; run `python install.py` to build the file."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._table = None
+        self._lock = threading.Lock()
+
+    @property
+    def table(self):
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    if not os.path.exists(self.path):
+                        raise LookupError(f"WordNet antonym index {self.path} is missing. "
+                                          f"Run `python install.py` in the FluxPseudoNegative node directory.")
+                    self._table = StringTable(self.path)
+        return self._table
+
+    def lookup(self, word):
+        """Return (most_common, first) antonyms for `word`, or None when WordNet has none."""
+        entry = self.table.get(word.lower())
+        return (entry[0], entry[1]) if entry else None
+
+    def counts(self, word):
+        entry = self.table.get(word.lower())
+        if not entry:
+            return {}
+        return {name: int(count) for name, count in (item.rsplit(":", 1) for item in entry[2].split(","))}
+
+
+wordnet_index = WordNetAntonymIndex()
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    build_wordnet_index(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INDEX_PATH)
+    build_modifier_words()
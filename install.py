@@ -0,0 +1,44 @@
+# install.py
+#
+# Run once after installing the requirements (ComfyUI Manager runs it automatically).
+# Fetches the NLTK data the node needs and prebuilds the WordNet antonym index, the
+# WordNet modifier word list, the default model's fill-mask candidate vocabulary and
+# embedding index, and the built-in phrase and strength tables, so the node itself never
+# downloads or builds anything in its directory at import or run time.
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flux_builtins import phrase_map, strength_map
+from flux_embeddings import EMBEDDING_DIR, build_embedding_index, embedding_paths
+from flux_models import DEFAULT_FILL_MASK_MODEL, VOCABULARY_DIR, build_vocabulary_file, vocabulary_path
+from flux_utils import install_nltk_resources
+from flux_wordnet import DEFAULT_INDEX_PATH, DEFAULT_MODIFIER_WORDS_PATH, build_modifier_words, build_wordnet_index
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print("Downloading NLTK data...")
+    install_nltk_resources()
+    print("NLTK data download complete")
+    # Compiles the built-in phrase and strength tables if they are missing or out of date
+    for table in (phrase_map, strength_map):
+        if table.is_stale():
+            table.compile()
+    if not os.path.exists(DEFAULT_INDEX_PATH):
+        build_wordnet_index(DEFAULT_INDEX_PATH)
+    if not os.path.exists(DEFAULT_MODIFIER_WORDS_PATH):
+        build_modifier_words(DEFAULT_MODIFIER_WORDS_PATH)
+    if not os.path.exists(vocabulary_path(VOCABULARY_DIR, DEFAULT_FILL_MASK_MODEL)):
+        try:
+            build_vocabulary_file(DEFAULT_FILL_MASK_MODEL, VOCABULARY_DIR)
+        except (ImportError, OSError) as e:
+            # Then the vocabulary is built in the user cache the first time it is needed
+            print(f"Skipping the fill-mask candidate vocabulary for {DEFAULT_FILL_MASK_MODEL}: {e}")
+    if not os.path.exists(embedding_paths(EMBEDDING_DIR, DEFAULT_FILL_MASK_MODEL)[0]):
+        try:
+            build_embedding_index(DEFAULT_FILL_MASK_MODEL)
+        except (ImportError, OSError) as e:
+            # Only the "embeddings" expansion engine needs it
+            print(f"Skipping the embedding index for {DEFAULT_FILL_MASK_MODEL}: {e}")
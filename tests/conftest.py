@@ -0,0 +1,180 @@
+# tests/conftest.py
+#
+# The tests run offline and need neither the NLTK data nor a model download. NLTK's data
+# lookup, tagger and WordNet corpus are replaced by small stubs (the WordNet antonym
+# index is built from the stub), fill-mask queries go to a deterministic fake pipeline
+# and ConceptNet to an in-process stub backend. Data compiled at run time goes to a
+# temporary FLUX_CACHE_DIR. The node package is imported from the repository root as
+# `flux_pseudo_negative`.
+import importlib.util
+import json
+import os
+import sys
+import zlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "flux_pseudo_negative"
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "corpus.json")
+
+
+def load_package():
+    """Import the node package from the repository root under a fixed module name."""
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(ROOT, "__init__.py"),
+                                                  submodule_search_locations=[ROOT])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+load_package()
+
+from flux_pseudo_negative import flux_cache, flux_conceptnet, flux_dictionaries, flux_engine, flux_models  # noqa: E402
+from flux_pseudo_negative import flux_wordnet  # noqa: E402
+
+# Stub WordNet: each word's antonyms, one list per synset
+WORDNET_ANTONYMS = {
+    "bad": [["good"]], "good": [["bad"], ["evil", "bad"]], "low": [["high"]], "high": [["low"]],
+    "dark": [["light"]], "light": [["dark"], ["heavy"]], "ugly": [["beautiful"]], "beautiful": [["ugly"]],
+    "boring": [["interesting"]], "dull": [["bright"], ["sharp"]], "rough": [["smooth"]], "poor": [["rich"]],
+    "incorrect": [["correct"]], "long": [["short"]], "small": [["large"]], "unnatural": [["natural"]],
+    "normal": [["abnormal"]], "inferior": [["superior"]], "happy": [["unhappy"]], "old": [["new"], ["young"]],
+}
+WORDNET_EXCEPTIONS = {"a": {"worst": ["bad"], "worse": ["bad"], "better": ["good"]}}
+# Stub tagger: these words are adjectives, "-ly" words adverbs and everything else a noun
+ADJECTIVES = set(WORDNET_ANTONYMS) | {
+    "blurry", "grainy", "noisy", "harsh", "sloppy", "amateurish", "deformed", "disfigured", "mutated", "extra",
+    "malformed", "fused", "asymmetrical", "stiff", "gloomy", "terrible", "overexposed", "underexposed", "flat",
+    "washed", "cropped", "missing", "weird", "strange", "awful", "subpar", "unrealistic", "unbalanced",
+}
+FILL_MASK_WORDS = ["bright", "clean", "sharp", "calm", "vivid", "detailed", "smooth", "natural", "crisp", "elegant"]
+
+
+class _Lemma:
+    def __init__(self, name, antonyms=()):
+        self._name = name
+        self._antonyms = antonyms
+
+    def name(self):
+        return self._name
+
+    def antonyms(self):
+        return [_Lemma(antonym) for antonym in self._antonyms]
+
+
+class _Synset:
+    def __init__(self, lemmas):
+        self._lemmas = lemmas
+
+    def lemmas(self):
+        return self._lemmas
+
+
+class StubWordNet:
+    ADJ, ADJ_SAT, ADV, NOUN, VERB = "a", "s", "r", "n", "v"
+    _exception_map = WORDNET_EXCEPTIONS
+
+    def _lemma(self, word):
+        word = word.lower()
+        for exceptions in self._exception_map.values():
+            if word in exceptions:
+                return exceptions[word][0]
+        for suffix in ("", "s", "er", "est", "ed"):
+            stem = word[:len(word) - len(suffix)]
+            if word.endswith(suffix) and stem in WORDNET_ANTONYMS:
+                return stem
+            if suffix and word.endswith(suffix) and stem[-2:-1] == stem[-1:] and stem[:-1] in WORDNET_ANTONYMS:
+                return stem[:-1]  # doubled final consonant, "blurred"
+        return word
+
+    def synsets(self, word):
+        lemma = self._lemma(word)
+        return [_Synset([_Lemma(lemma, antonyms)]) for antonyms in WORDNET_ANTONYMS.get(lemma, [])]
+
+    def all_lemma_names(self, pos=None):
+        if pos in (None, self.ADJ, self.ADJ_SAT):
+            return sorted(ADJECTIVES)
+        return []
+
+
+def stub_pos_tag(words):
+    return [(word, "JJ" if word.lower() in ADJECTIVES else "RB" if word.endswith("ly") else "NN") for word in words]
+
+
+class FakeFillMask:
+    """Deterministic stand-in for the transformers fill-mask pipeline."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def answer(self, text, top_k):
+        word = text.split()[3]
+        start = zlib.crc32(word.encode("utf-8")) % len(FILL_MASK_WORDS)
+        # The word itself and unusable tokens come first, as a real model often returns them
+        tokens = [word, "##s", "ok"] + FILL_MASK_WORDS[start:] + FILL_MASK_WORDS[:start]
+        return [{"score": round(1.0 / (rank + 2), 6), "token_str": token, "sequence": text.replace("[MASK]", token)}
+                for rank, token in enumerate(tokens[:top_k])]
+
+    def __call__(self, texts, top_k=5, batch_size=1):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("fill-mask model failed")
+        if isinstance(texts, str):
+            return self.answer(texts, top_k)
+        outputs = [self.answer(text, top_k) for text in texts]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+class StubConceptNet(flux_conceptnet.ConceptNetBackend):
+    errors = 0
+
+    def antonyms(self, word, limit=3):
+        return [f"{word} opposite {i}" for i in range(limit)]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def offline(tmp_path_factory):
+    """Run every test against the stubs above, with data files in a temporary directory."""
+    import nltk
+    import nltk.corpus
+
+    data = tmp_path_factory.mktemp("data")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("FLUX_CACHE_DIR", str(data / "cache"))
+        patch.setattr(nltk.data, "find", lambda resource, *args, **kwargs: resource)
+        patch.setattr(nltk, "download", lambda *args, **kwargs: pytest.fail("tests must not download NLTK data"))
+        patch.setattr(nltk, "pos_tag", stub_pos_tag)
+        patch.setattr(nltk, "pos_tag_sents", lambda sentences: [stub_pos_tag(words) for words in sentences])
+        patch.setattr(nltk.corpus, "wordnet", StubWordNet())
+        index_path = flux_wordnet.build_wordnet_index(str(data / "wordnet_antonyms.fpnt"))
+        patch.setattr(flux_wordnet.wordnet_index, "path", index_path)
+        patch.setattr(flux_engine, "fill_mask_registry", flux_models.FillMaskRegistry(lambda *args: FakeFillMask()))
+        patch.setattr(flux_dictionaries.custom_dictionaries, "directory", str(data / "dictionaries"))
+        patch.setattr(flux_dictionaries.custom_dictionaries, "cache_dir", str(data / "dictionary_cache"))
+        previous = flux_conceptnet.set_conceptnet_backend(StubConceptNet())
+        yield data
+        flux_conceptnet.set_conceptnet_backend(previous)
+
+
+def clear_caches():
+    flux_cache.antonym_cache.clear()
+    flux_cache.result_cache.clear()
+
+
+@pytest.fixture
+def engine():
+    """A fresh engine, with the process-wide antonym and result caches emptied."""
+    clear_caches()
+    yield flux_engine.FluxPseudoNegativeEngine()
+    clear_caches()
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return json.load(f)["prompts"]
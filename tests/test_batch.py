@@ -0,0 +1,40 @@
+# tests/test_batch.py
+#
+# The batch node must convert every pair exactly as one single-prompt run per pair does.
+import pytest
+
+from flux_pseudo_negative import NODE_CLASS_MAPPINGS
+from conftest import clear_caches
+
+
+def run_list(node, negatives, positives, complexity):
+    return node.run_list(negatives, positives, strength=[0.5], complexity=[complexity],
+                         system_prompt_choice=["default"], use_llm_fallback=[True])
+
+
+@pytest.mark.parametrize("complexity", ["basic", "advanced", "expert"])
+def test_batch_node_matches_one_run_per_pair(corpus, complexity):
+    node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"]()
+    batch_node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeBatchNode"]()
+    negatives = [prompt["negative"] for prompt in corpus]
+    positives = [prompt["positive"] for prompt in corpus]
+    for batch_negatives, batch_positives in [(negatives, positives), (negatives, positives[:1]),
+                                             (negatives[:1], positives)]:
+        count = max(len(batch_negatives), len(batch_positives))
+        pairs = [(batch_negatives[i % len(batch_negatives)], batch_positives[i % len(batch_positives)])
+                 for i in range(count)]
+        clear_caches()
+        expected = [node.run(negative, positive, 0.5, complexity, "default", use_llm_fallback=True)[:2]
+                    for negative, positive in pairs]
+        clear_caches()
+        batch_node.run_memo.clear()
+        results, llm_inputs, metrics = run_list(batch_node, batch_negatives, batch_positives, complexity)
+        assert list(zip(results, llm_inputs)) == expected
+        assert metrics == [""] * count
+    clear_caches()
+
+
+def test_mismatched_prompt_lists_are_rejected():
+    batch_node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeBatchNode"]()
+    with pytest.raises(ValueError, match="2 positive and 3 negative"):
+        run_list(batch_node, ["blurry", "dark", "ugly"], ["a cat", "a dog"], "basic")
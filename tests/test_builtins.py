@@ -0,0 +1,24 @@
+# tests/test_builtins.py
+import os
+
+from flux_pseudo_negative import flux_builtins, flux_tables
+
+
+def test_stale_table_is_read_from_the_tsv_without_compiling(tmp_path):
+    source = tmp_path / "strength_map.tsv"
+    source.write_text("# word\tstrength\nblurry\t0.7\nbad\t0.9\n", encoding="utf-8")
+    table = flux_builtins.BuiltinTable(str(source), flux_builtins.parse_strength, float)
+    assert table.is_stale()
+    assert table["blurry"] == 0.7 and table.get("sharp") is None and sorted(table) == ["bad", "blurry"]
+    assert not os.path.exists(table.path)
+
+
+def test_compiled_table_matches_the_tsv(tmp_path):
+    source = tmp_path / "phrase_map.tsv"
+    source.write_text("bad anatomy\tcorrect anatomy\nlow quality\thigh quality\n", encoding="utf-8")
+    table = flux_builtins.BuiltinTable(str(source))
+    table.compile()
+    assert not table.is_stale()
+    assert isinstance(table.table, flux_tables.StringTable)
+    assert dict(table) == {"bad anatomy": "correct anatomy", "low quality": "high quality"}
+    assert 42 not in table
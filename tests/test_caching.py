@@ -0,0 +1,94 @@
+# tests/test_caching.py
+#
+# Results degraded by a failing fill-mask model must not be cached, in the result cache or
+# in the engine's run memo, so the next run with a working model recomputes them. The antonym
+# cache evicts least recently used entries, is keyed on the custom antonyms and the WordNet
+# index, and its SQLite store is reloaded by a new process.
+import json
+import subprocess
+import sys
+
+import pytest
+
+import conftest
+from flux_pseudo_negative import flux_cache, flux_engine, flux_models, flux_wordnet
+from conftest import FakeFillMask
+
+PAIR = ("a portrait", "bad, ugly, dark")  # resolved from WordNet, so only the expansion needs the model
+
+
+def failing_embedding_engine(*args):
+    raise RuntimeError("embedding model failed")
+
+
+@pytest.fixture
+def failing_model(monkeypatch):
+    monkeypatch.setattr(flux_engine, "fill_mask_registry",
+                        flux_models.FillMaskRegistry(lambda *args: FakeFillMask(fail=True)))
+    monkeypatch.setattr(flux_engine, "get_embedding_engine", failing_embedding_engine)
+
+
+@pytest.mark.parametrize("expansion_engine", ["fill_mask", "embeddings"])
+def test_failed_expansion_is_counted_and_not_memoised(engine, failing_model, expansion_engine):
+    state = engine.conversion_state(expansion_engine=expansion_engine)
+    assert engine.expand_concept(state, "good") == ["good"]
+    assert state.transformer_errors == 1
+    assert engine.expansion_memo_key(state, "good", 2) not in engine.run_memo
+
+
+def test_run_with_failed_expansions_is_not_cached(engine, failing_model, monkeypatch):
+    (degraded, _), = engine.run_batch([PAIR], 0.5, "advanced", "default")
+    assert flux_cache.result_cache.stats()["size"] == 0
+    monkeypatch.undo()
+    (result, _), = engine.run_batch([PAIR], 0.5, "advanced", "default")
+    assert result != degraded
+    assert flux_cache.result_cache.stats()["size"] == 1
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = flux_cache.AntonymCache(max_size=2)
+    cache.put(("word", "a"), "x")
+    cache.put(("word", "b"), "y")
+    assert cache.get(("word", "a")) == "x"
+    cache.put(("word", "c"), "z")
+    assert ("word", "b") not in cache
+    assert cache.get(("word", "a")) == "x" and cache.get(("word", "c")) == "z"
+    assert cache.get(("word", "b")) is None
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1, "hit_rate": 0.75}
+
+
+def test_changed_custom_antonyms_are_not_answered_from_the_cache(engine):
+    for custom_antonyms, expected in [("blurry:crisp", "crisp"), ("blurry:clear", "clear"), (None, "sharp"),
+                                      ("blurry:crisp", "crisp")]:
+        state = engine.conversion_state(custom_antonyms)
+        assert engine.get_single_word_antonym(state, "blurry")[0] == expected
+        (result, _), = engine.run_batch([("", "blurry")], 0.5, "basic", "default", custom_antonyms=custom_antonyms)
+        assert result == f", {expected}"
+
+
+def test_rebuilt_wordnet_index_invalidates_cached_antonyms(engine, tmp_path, monkeypatch):
+    path = flux_wordnet.build_wordnet_index(str(tmp_path / "wordnet_antonyms.fpnt"))
+    monkeypatch.setattr(flux_wordnet.wordnet_index, "path", path)
+    monkeypatch.setattr(flux_wordnet.wordnet_index, "_table", None)
+    assert engine.get_single_word_antonym(engine.conversion_state(), "dark")[0] == "light"
+    monkeypatch.setitem(conftest.WORDNET_ANTONYMS, "dark", [["bright"]])
+    flux_wordnet.build_wordnet_index(path)
+    monkeypatch.setattr(flux_wordnet.wordnet_index, "_table", None)
+    assert engine.get_single_word_antonym(engine.conversion_state(), "dark")[0] == "bright"
+
+
+def test_persisted_entries_are_reloaded_in_a_new_process(tmp_path):
+    path = str(tmp_path / "antonyms.sqlite")
+    cache = flux_cache.AntonymCache(path=path)
+    cache.put(("word", "blurry", "chain", ""), ("sharp", "wordnet"))
+    cache.put(("phrase", "bad hands", "chain", "abc"), ("good hands", "transformer"))
+    assert cache.flush() == 2
+    code = ("import json, sys\n"
+            f"sys.path.insert(0, {conftest.ROOT!r})\n"
+            "import flux_cache\n"
+            f"cache = flux_cache.AntonymCache(max_size=1, path={path!r})\n"
+            "print(json.dumps([cache.get(('word', 'blurry', 'chain', '')), "
+            "cache.get(('phrase', 'bad hands', 'chain', 'abc'))]))\n")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    # Only the most recent entries fit, so the older one is not warm-loaded
+    assert json.loads(output) == [None, ["good hands", "transformer"]]
@@ -0,0 +1,94 @@
+# tests/test_conceptnet.py
+#
+# The HTTP ConceptNet backend against a stub API server on a free local port.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from flux_pseudo_negative import flux_cache, flux_conceptnet
+
+TIMEOUT = 0.2
+
+
+class ConceptNetStub(BaseHTTPRequestHandler):
+    """Antonym edges for any term; "missing" is not found, "empty" has no edges and "slow" times out."""
+    protocol_version = "HTTP/1.1"
+    statuses = {"missing": 404}
+    requested = []
+
+    def do_GET(self):
+        term = unquote(self.path.rstrip("/").rsplit("/", 1)[-1])
+        self.requested.append(term)
+        if term == "slow":
+            time.sleep(TIMEOUT * 5)
+        status = self.statuses.get(term, 200)
+        edges = [] if term == "empty" else [{"rel": {"label": "Antonym"}, "end": {"label": f"{term} opposite {i}"}}
+                                             for i in range(4)]
+        edges.append({"rel": {"label": "RelatedTo"}, "end": {"label": "unrelated"}})
+        body = json.dumps({"edges": edges} if status == 200 else {"error": "stub error"}).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:  # the client gave up waiting
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(ConceptNetStub, "requested", [])
+    monkeypatch.setattr(ConceptNetStub, "statuses", dict(ConceptNetStub.statuses))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ConceptNetStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = flux_conceptnet.HttpConceptNetBackend("http://%s:%s" % server.server_address[:2], timeout=TIMEOUT,
+                                                    retries=0)
+    previous = flux_conceptnet.set_conceptnet_backend(backend)
+    yield backend
+    flux_conceptnet.set_conceptnet_backend(previous)
+    backend.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_antonym_edges_are_returned_and_cached(backend):
+    assert backend.antonyms("Bad Anatomy", limit=3) == [f"bad_anatomy opposite {i}" for i in range(3)]
+    assert backend.antonyms("bad anatomy", limit=2) == ["bad_anatomy opposite 0", "bad_anatomy opposite 1"]
+    assert ConceptNetStub.requested == ["bad_anatomy"]
+    assert backend.errors == 0
+
+
+def test_missing_and_empty_terms_have_no_antonyms(backend):
+    assert backend.antonyms_many(["empty", "missing", "empty"]) == {"empty": [], "missing": []}
+    assert backend.errors == 1  # only the 404 is an error; an empty edge list is an answer
+
+
+def test_timeouts_are_counted_as_errors(backend):
+    start = time.perf_counter()
+    assert backend.antonyms("slow") == []
+    assert time.perf_counter() - start < TIMEOUT * 4
+    assert backend.errors == 1
+    assert backend.antonyms("fast") == [f"fast opposite {i}" for i in range(3)]
+
+
+def test_failed_lookups_are_counted_and_not_cached(engine, backend):
+    ConceptNetStub.statuses["sharp"] = 500
+    state = engine.conversion_state()
+    (degraded, _), = engine.convert_batch(state, [("", "blurry")], 0.5, "basic", "default", use_conceptnet=True)
+    assert degraded == ", sharp"
+    assert state.conceptnet_errors == 1
+    assert flux_cache.result_cache.stats()["size"] == 0
+    state = engine.conversion_state()
+    assert engine.expand_with_conceptnet(state, ["sharp"]) == ["sharp"]
+    assert state.conceptnet_errors == 1
+    del ConceptNetStub.statuses["sharp"]
+    (result, _), = engine.run_batch([("", "blurry")], 0.5, "basic", "default", use_conceptnet=True)
+    assert result == ", sharp, sharp opposite 0, sharp opposite 1, sharp opposite 2"
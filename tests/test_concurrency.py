@@ -0,0 +1,38 @@
+# tests/test_concurrency.py
+#
+# One node shared by many threads must convert every prompt exactly as a serial run does.
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from flux_pseudo_negative import NODE_CLASS_MAPPINGS
+from conftest import clear_caches
+
+COMPLEXITIES = ["basic", "advanced", "expert"]
+STRESS_THREADS = 16
+STRESS_ROUNDS = 4
+
+
+def test_concurrent_runs_match_serial_runs(corpus):
+    node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"]()
+    jobs = [(prompt["negative"], prompt["positive"], complexity, use_conceptnet)
+            for prompt in corpus for complexity in COMPLEXITIES for use_conceptnet in (False, True)]
+
+    def convert(job):
+        negative, positive, complexity, use_conceptnet = job
+        return node.run(negative, positive, 0.5, complexity, "default", use_conceptnet=use_conceptnet)[:2]
+
+    clear_caches()
+    expected = {job: convert(job) for job in jobs}
+    clear_caches()
+    node.run_memo.clear()
+    # The first round converts concurrently from cold caches, later rounds race on the warm caches
+    schedule = []
+    for round_index in range(STRESS_ROUNDS):
+        round_jobs = list(jobs)
+        random.Random(round_index).shuffle(round_jobs)
+        schedule += round_jobs
+    with ThreadPoolExecutor(max_workers=STRESS_THREADS) as executor:
+        outputs = list(executor.map(convert, schedule))
+    clear_caches()
+    mismatches = [job for job, output in zip(schedule, outputs) if output != expected[job]]
+    assert mismatches == []
@@ -0,0 +1,69 @@
+# tests/test_embeddings.py
+#
+# The embedding expansion engine with a stub encoder that places every text at a known angle
+# on the unit circle, so the nearest neighbours of each query are known exactly.
+import importlib.util
+import math
+
+import numpy as np
+import pytest
+
+from flux_pseudo_negative import flux_embeddings, flux_engine
+
+TARGET_ANGLES = {"sharp": 0, "crisp": 20, "clear": 45, "bright": 90, "vivid": 110, "calm": 180, "smooth": 200,
+                 "well-composed": 270}
+QUERY_ANGLES = {"focused": 5, "luminous": 95, "serene": 185, "balanced": 260}
+NEIGHBOURS = {"focused": ["sharp", "crisp"], "luminous": ["bright", "vivid"], "serene": ["calm", "smooth"],
+              "balanced": ["well-composed", "smooth"], "sharp": ["crisp", "clear"]}
+
+
+class StubEmbeddingEngine(flux_embeddings.EmbeddingEngine):
+    def __init__(self, directory, use_ann=False):
+        super().__init__("stub/model", directory=str(directory), use_ann=use_ann)
+        self.encoded = []
+
+    def _encode(self, texts, batch_size=None):
+        self.encoded.append(list(texts))
+        angles = [math.radians({**TARGET_ANGLES, **QUERY_ANGLES}[text]) for text in texts]
+        return np.array([[math.cos(angle), math.sin(angle)] for angle in angles], dtype=np.float32)
+
+
+@pytest.fixture
+def built_index(tmp_path):
+    StubEmbeddingEngine(tmp_path).build_index(list(TARGET_ANGLES))
+    return tmp_path
+
+
+@pytest.mark.parametrize("use_ann", [False, True])
+def test_neighbours_are_the_nearest_targets(built_index, use_ann):
+    engine = StubEmbeddingEngine(built_index, use_ann=use_ann)
+    assert engine.neighbours(list(NEIGHBOURS), top_n=2) == NEIGHBOURS
+    # Without faiss, an ANN search falls back to the exact search
+    assert (engine.index._ann is not None) == (use_ann and importlib.util.find_spec("faiss") is not None)
+    assert engine.encoded == [list(NEIGHBOURS)]  # the targets are read from the index, not encoded again
+    assert engine.neighbours(["serene", "focused"], top_n=1) == {"serene": ["calm"], "focused": ["sharp"]}
+    assert engine.encoded == [list(NEIGHBOURS)]  # query embeddings are cached
+
+
+@pytest.mark.parametrize("use_ann", [False, True])
+def test_search_ranks_targets_by_similarity(built_index, use_ann):
+    engine = StubEmbeddingEngine(built_index, use_ann=use_ann)
+    indices, scores = engine.index.search(engine.encode(["focused"]), 3)
+    assert [engine.index.labels[i] for i in indices[0]] == ["sharp", "crisp", "clear"]
+    assert np.allclose(scores[0], np.cos(np.radians([5, 15, 40])), atol=1e-5)
+
+
+def test_missing_index_is_reported_instead_of_built(tmp_path, engine, monkeypatch):
+    stub = StubEmbeddingEngine(tmp_path)
+    with pytest.raises(LookupError, match="install.py"):
+        stub.neighbours(["focused"])
+    assert stub.encoded == [] and list(tmp_path.iterdir()) == []
+    monkeypatch.setattr(flux_engine, "get_embedding_engine", lambda *args: stub)
+    with pytest.raises(LookupError, match="install.py"):
+        engine.run_batch([("", "blurry")], 0.5, "advanced", "default", expansion_engine="embeddings")
+
+
+def test_runs_expand_antonyms_to_their_neighbours(built_index, engine, monkeypatch):
+    monkeypatch.setattr(flux_engine, "get_embedding_engine", lambda *args: StubEmbeddingEngine(built_index))
+    (result, _), = engine.run_batch([("", "blurry")], 0.5, "advanced", "default", expansion_engine="embeddings")
+    assert result == ", sharp, crisp, clear"
@@ -0,0 +1,33 @@
+# tests/test_fill_mask.py
+#
+# Batched fill-mask queries must return exactly what one pipeline call per word returns, so
+# the transformer strategy picks the same antonyms whether or not its words were prefetched.
+import pytest
+
+from flux_pseudo_negative import flux_engine, flux_models
+from conftest import FakeFillMask
+
+WORDS = ["blurry", "grainy", "noisy", "harsh", "sloppy", "watermark", "cropped"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, len(WORDS) + 5])
+def test_batched_fill_mask_matches_per_word_calls(batch_size):
+    pipe = FakeFillMask()
+    batched = flux_models.batched_fill_mask(pipe, WORDS + WORDS[:2], batch_size=batch_size)
+    assert list(batched) == WORDS
+    for word in WORDS:
+        assert batched[word] == pipe(flux_models.FILL_MASK_TEMPLATE.format(word), top_k=flux_models.FILL_MASK_TOP_K)
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, len(WORDS) + 5])
+def test_prefetched_antonyms_match_per_word_antonyms(engine, batch_size):
+    prefetched = engine.conversion_state(fill_mask_batch_size=batch_size)
+    engine.prefetch_fill_mask(prefetched, WORDS)
+    assert set(prefetched.fill_mask_results) == set(WORDS)
+    per_word = engine.conversion_state(fill_mask_batch_size=batch_size)
+    pipe = flux_engine.fill_mask_registry.get()
+    calls = pipe.calls
+    assert ([engine.transformer_strategy(prefetched, word) for word in WORDS]
+            == [engine.transformer_strategy(per_word, word) for word in WORDS])
+    assert pipe.calls == calls + len(WORDS)  # only the per-word state queried the model
+    assert prefetched.transformer_errors == per_word.transformer_errors == 0
@@ -0,0 +1,58 @@
+# tests/test_import.py
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from flux_pseudo_negative import flux_utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = 100.0
+HEAVY_MODULES = ["nltk", "numpy", "requests", "textblob", "torch", "transformers", "onnxruntime"]
+IMPORT_CODE = f"""
+import importlib.util, json, sys, time
+spec = importlib.util.spec_from_file_location("flux_pseudo_negative", {os.path.join(ROOT, "__init__.py")!r},
+                                              submodule_search_locations=[{ROOT!r}])
+module = importlib.util.module_from_spec(spec)
+sys.modules["flux_pseudo_negative"] = module
+start = time.perf_counter()
+spec.loader.exec_module(module)
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed_ms, "heavy": sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)}}))
+"""
+
+
+def cold_import():
+    """Import the package in a fresh interpreter; returns its import time and the heavy modules it loaded."""
+    output = subprocess.run([sys.executable, "-c", IMPORT_CODE], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_loads_no_heavy_dependencies():
+    assert cold_import()["heavy"] == []
+
+
+def test_import_time_is_within_budget():
+    # The fastest of a few runs, so a busy machine does not fail the budget
+    assert min(cold_import()["ms"] for _ in range(3)) < IMPORT_BUDGET_MS
+
+
+def test_missing_nltk_data_is_reported_without_downloading(monkeypatch):
+    import nltk
+
+    def find(resource, *args, **kwargs):
+        raise LookupError(resource)
+
+    monkeypatch.setattr(nltk.data, "find", find)
+    monkeypatch.setattr(flux_utils, "_checked_resources", set())
+    with pytest.raises(LookupError, match="install.py"):
+        flux_utils.require_nltk_resource("wordnet")
+
+
+def test_conversion_runs_offline(engine):
+    (result, llm_input), = engine.run_batch([("a portrait", "blurry, low quality, bad anatomy")], 0.5, "basic",
+                                            "default", fill_mask_vocabulary="full")
+    assert result.startswith("a portrait, ")
+    assert llm_input == ""
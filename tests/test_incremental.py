@@ -0,0 +1,38 @@
+# tests/test_incremental.py
+#
+# Re-converting an edited prompt reuses the tags an earlier run resolved; the output must be
+# identical to converting the edited prompt from empty caches.
+import pytest
+
+from flux_pseudo_negative import NODE_CLASS_MAPPINGS
+from conftest import clear_caches
+
+INCREMENTAL_EDIT = "washed out colors"
+
+
+def edited_negative(negative):
+    """`negative` with its middle tag replaced by INCREMENTAL_EDIT."""
+    tags = negative.split(",")
+    tags[len(tags) // 2] = f" {INCREMENTAL_EDIT}" if len(tags) > 1 else INCREMENTAL_EDIT
+    return ",".join(tags)
+
+
+@pytest.mark.parametrize("complexity", ["basic", "advanced", "expert"])
+def test_incremental_conversion_matches_full_recompute(corpus, complexity):
+    node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"]()
+    mismatches = []
+    for prompt in corpus:
+        def convert(negative):
+            return node.run(negative, prompt["positive"], 0.5, complexity, "default")[:2]
+
+        edited = edited_negative(prompt["negative"])
+        clear_caches()
+        node.run_memo.clear()
+        convert(prompt["negative"])
+        incremental = convert(edited)
+        clear_caches()
+        node.run_memo.clear()
+        if incremental != convert(edited):
+            mismatches.append(prompt["name"])
+    clear_caches()
+    assert mismatches == []
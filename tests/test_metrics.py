@@ -0,0 +1,52 @@
+# tests/test_metrics.py
+import logging
+import threading
+
+from flux_pseudo_negative import flux_cache, flux_engine
+from flux_pseudo_negative.flux_metrics import metrics, profile_run
+
+
+def test_concurrent_profiled_runs_do_not_collide(tmp_path, caplog):
+    entered = threading.Event()
+    release = threading.Event()
+    sessions = []
+
+    def first_run():
+        with profile_run("cprofile", str(tmp_path)) as session:
+            sessions.append(session)
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=first_run)
+    thread.start()
+    assert entered.wait(5)
+    with caplog.at_level(logging.WARNING), profile_run("cprofile", str(tmp_path)) as second:
+        assert second is None
+    release.set()
+    thread.join()
+    assert sessions[0] is not None
+    assert "Another run is being profiled" in caplog.text
+    assert len(list(tmp_path.glob("*.prof"))) == 1
+    # The profiler is free again once the first run has finished
+    with profile_run("cprofile", str(tmp_path)) as third:
+        assert third is not None
+
+
+def counter_changes(before, after):
+    return {key: value - before.get(key, 0) for key, value in after.items() if value != before.get(key, 0)}
+
+
+def test_cached_antonyms_are_counted_under_the_strategy_that_resolved_them(engine):
+    assert engine.get_single_word_antonym(engine.conversion_state(), "dark") == ("light", "wordnet")
+    before = metrics.snapshot()["counters"]
+    assert engine.get_single_word_antonym(engine.conversion_state(), "dark") == ("light", "wordnet")
+    assert counter_changes(before, metrics.snapshot()["counters"]) == {
+        ("flux_antonym_cache_total", (("result", "hit"),)): 1,
+        ("flux_antonym_strategy_total", (("strategy", "wordnet"),)): 1,
+    }
+    # New engines have no run memo, so the second one's tags are all answered from the antonym cache
+    for _ in range(2):
+        flux_cache.result_cache.clear()
+        other = flux_engine.FluxPseudoNegativeEngine()
+        other.run_batch([("", "dark, bad hands")], 0.5, "basic", "default")
+        assert other.last_run_summary["strategies"] == {"dark": "wordnet", "bad hands": "wordnet"}
@@ -0,0 +1,118 @@
+# tests/test_models.py
+import threading
+import time
+
+import pytest
+
+from flux_pseudo_negative import flux_models
+from conftest import FakeFillMask
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_loading_one_model_does_not_block_other_models():
+    release = threading.Event()
+
+    def loader(model, device, backend):
+        if model == "slow":
+            release.wait(5)
+        return FakeFillMask()
+
+    registry = flux_models.FillMaskRegistry(loader)
+    loaded = registry.get("fast")
+    slow = threading.Thread(target=registry.get, args=("slow",))
+    slow.start()
+    try:
+        lookup = threading.Thread(target=lambda: (registry.get("fast"), registry.get("other")))
+        lookup.start()
+        lookup.join(2)
+        assert not lookup.is_alive()
+        assert registry.get("fast") is loaded
+        assert not registry.is_loaded("slow")
+    finally:
+        release.set()
+        slow.join()
+    assert registry.is_loaded("slow")
+
+
+def test_concurrent_loads_of_one_model_load_it_once():
+    calls = []
+
+    def loader(model, device, backend):
+        calls.append(model)
+        time.sleep(0.05)
+        return FakeFillMask()
+
+    registry = flux_models.FillMaskRegistry(loader)
+    threads = [threading.Thread(target=registry.get, args=("model",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["model"]
+
+
+def test_idle_models_are_unloaded_in_the_background():
+    registry = flux_models.FillMaskRegistry(lambda *args: FakeFillMask(), idle_seconds=0.05)
+    registry.get("model")
+    assert wait_until(lambda: not registry.is_loaded("model"))
+    registry.get("model")
+    assert registry.is_loaded("model")
+
+
+class FakeTokenizer:
+    all_special_ids = [0]
+
+    def __init__(self, tokens):
+        self.vocab = {token: token_id for token_id, token in enumerate(["[MASK]"] + tokens)}
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def get_vocab(self):
+        return dict(self.vocab)
+
+    def convert_tokens_to_string(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def vocabulary_dirs(tmp_path, monkeypatch):
+    """(package vocabulary directory, user cache directory), both empty."""
+    monkeypatch.setattr(flux_models, "VOCABULARY_DIR", str(tmp_path / "data" / "vocabulary"))
+    monkeypatch.setenv("FLUX_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(flux_models, "modifier_words", lambda: {"sharp", "bright"})
+    return tmp_path / "data" / "vocabulary", tmp_path / "cache" / "vocabulary"
+
+
+def test_vocabulary_built_at_run_time_goes_to_the_user_cache(vocabulary_dirs, monkeypatch):
+    package_dir, cache_dir = vocabulary_dirs
+    tokenizer = FakeTokenizer(["sharp", "##s", "dog", "bright", "ok"])
+    vocabulary = flux_models.load_candidate_vocabulary(tokenizer, "some/model")
+    assert vocabulary.tokens == ["sharp", "bright"] and vocabulary.token_ids.tolist() == [1, 4]
+    assert not package_dir.exists()
+    assert [path.name for path in cache_dir.iterdir()] == ["some--model.npz"]
+    monkeypatch.setattr(flux_models, "build_candidate_vocabulary", lambda *args: pytest.fail("rebuilt"))
+    assert flux_models.load_candidate_vocabulary(tokenizer, "some/model").tokens == ["sharp", "bright"]
+
+
+def test_vocabulary_from_install_is_used_first(vocabulary_dirs):
+    package_dir, cache_dir = vocabulary_dirs
+    tokenizer = FakeTokenizer(["sharp", "bright"])
+    installed = flux_models.build_candidate_vocabulary(tokenizer, {"bright"})
+    flux_models.write_candidate_vocabulary(flux_models.vocabulary_path(str(package_dir), "model"), installed,
+                                           len(tokenizer))
+    assert flux_models.load_candidate_vocabulary(tokenizer, "model").tokens == ["bright"]
+    assert not cache_dir.exists()
+
+
+def test_vocabulary_is_kept_in_memory_when_the_cache_is_not_writable(vocabulary_dirs, tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setenv("FLUX_CACHE_DIR", str(tmp_path / "file" / "cache"))
+    vocabulary = flux_models.load_candidate_vocabulary(FakeTokenizer(["sharp", "bright"]), "model")
+    assert vocabulary.tokens == ["sharp", "bright"]
@@ -0,0 +1,44 @@
+# tests/test_onnx.py
+#
+# The ONNX backends must rank fill-mask candidates like the transformers pipeline. The model
+# is a tiny randomly initialised BERT written to a temporary directory, so nothing is downloaded.
+import pytest
+
+from flux_pseudo_negative import flux_models, flux_onnx
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+MIN_TOP1_AGREEMENT = {"onnx": 1.0, "onnx-int8": 0.9}
+MAX_SCORE_DELTA = {"onnx": 1e-5, "onnx-int8": 1e-3}
+VOCABULARY_WORDS = ["the", "opposite", "of", "is", "good", "bad", "sharp", "blurry", "dark", "light", "happy", "sad",
+                    "ugly", "beautiful", "clean", "noisy", "quality", "high", "low", "calm", "neat", "weird", "thing"]
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tiny-bert")
+    vocabulary = (["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ","] + VOCABULARY_WORDS
+                  + [f"w{i}" for i in range(200)] + list("abcdefghijklmnopqrstuvwxyz")
+                  + ["##" + c for c in "abcdefghijklmnopqrstuvwxyz"])
+    (directory / "vocab.txt").write_text("\n".join(vocabulary), encoding="utf-8")
+    transformers.BertTokenizerFast(str(directory / "vocab.txt"), do_lower_case=True).save_pretrained(directory)
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(vocabulary), hidden_size=32, num_hidden_layers=2,
+                                     num_attention_heads=2, intermediate_size=64, max_position_embeddings=64)
+    transformers.BertForMaskedLM(config).save_pretrained(directory)
+    return str(directory)
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_backend_agrees_with_transformers(backend, tiny_model, corpus, tmp_path, monkeypatch):
+    monkeypatch.setattr(flux_onnx, "ONNX_CACHE_DIR", str(tmp_path))
+    words = list(dict.fromkeys(word for prompt in corpus for tag in prompt["negative"].split(",")
+                               for word in tag.split() if word.isalpha()))
+    reference = flux_models.load_fill_mask(tiny_model, -1, "transformers")
+    candidate = flux_models.load_fill_mask(tiny_model, -1, backend)
+    agreement = flux_models.compare_fill_mask(reference, candidate, words)
+    assert agreement["top1_agreement"] >= MIN_TOP1_AGREEMENT[backend]
+    assert agreement["max_score_delta"] <= MAX_SCORE_DELTA[backend]
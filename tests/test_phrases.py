@@ -0,0 +1,132 @@
+# tests/test_phrases.py
+import random
+
+from flux_pseudo_negative import flux_dictionaries, flux_utils
+
+PIECES = ["blurry", "bad", "quality", "low quality", "bad anatomy", "(", ")", "don't", "x-y", ":", "!", "1.4", "2"]
+SEPARATORS = [" ", ", ", ",", "", "  ", "\t"]
+
+
+def random_prompts(count=2000):
+    rng = random.Random(0)
+    phrases = list(flux_utils.builtin_phrases)[:200]
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 12)):
+            parts.append(rng.choice(phrases) if rng.random() < 0.4 else rng.choice(PIECES))
+            parts.append(rng.choice(SEPARATORS))
+        yield "".join(parts)
+
+
+def test_replaced_prompt_tokens_match_a_fresh_tokenisation():
+    handler = flux_utils.PhraseHandler()
+    for text in random_prompts():
+        processed, _, _ = handler.replace_phrase_tokens(flux_utils.PromptTokens(text))
+        fresh = flux_utils.PromptTokens(processed.text)
+        assert processed.tokens == fresh.tokens
+        assert list(processed.starts) == list(fresh.starts)
+        assert list(processed.ends) == list(fresh.ends)
+
+
+def test_tags_split_like_the_prompt_text():
+    for text in random_prompts():
+        prompt = flux_utils.PromptTokens(text)
+        assert [tag for tag, _ in prompt.tags()] == [tag.strip() for tag in text.split(",") if tag.strip()]
+        assert all(tokens == flux_utils.phrase_tokens(tag) for tag, tokens in prompt.tags())
+
+
+def test_builtin_phrase_replacements_are_not_emitted(engine):
+    replacement = flux_utils.builtin_phrases["bad anatomy"]
+    (result, _), = engine.run_batch([("a portrait", f"bad anatomy, {replacement}, blurry")], 0.5, "basic", "default")
+    assert replacement not in result.split(", ")
+
+
+def test_custom_phrase_replacements_are_emitted(engine):
+    (result, _), = engine.run_batch([("a portrait", "weird thing, blurry")], 0.5, "basic", "default",
+                                    custom_antonyms="weird thing:normal thing")
+    assert "normal thing" in result.split(", ")
+
+
+def test_custom_phrases_are_layered_over_shared_tries(tmp_path):
+    (tmp_path / "shop.tsv").write_text("weird thing\tnormal thing\nbad anatomy\tperfect anatomy\n", encoding="utf-8")
+    store = flux_dictionaries.DictionaryStore(str(tmp_path), str(tmp_path / "cache"))
+    first = store.load("ugly face:pretty face").phrase_handler
+    second = store.load("odd hands:fine hands").phrase_handler
+    directory = store.load("").phrase_handler
+    assert first.layers[0][0] is flux_utils.builtin_phrase_trie()
+    for handler in (first, second):
+        assert all(layer is shared for layer, shared in zip(handler.layers, directory.layers))
+    assert first.replace_phrases("bad anatomy, ugly face, odd hands")[0] == "perfect anatomy, pretty face, odd hands"
+
+
+def test_dictionaries_are_compiled_into_the_user_cache(tmp_path, monkeypatch):
+    (tmp_path / "dictionaries").mkdir()
+    (tmp_path / "dictionaries" / "shop.tsv").write_text("weird\tnormal\nodd hands\tfine hands\n", encoding="utf-8")
+    monkeypatch.setenv("FLUX_CACHE_DIR", str(tmp_path / "cache"))
+    dictionary = flux_dictionaries.DictionaryStore(str(tmp_path / "dictionaries")).load("")
+    assert dictionary.get("weird") == "normal" and dictionary.has_phrase("odd hands")
+    assert isinstance(dictionary.directory.words, flux_dictionaries.StringTable)
+    assert len(list((tmp_path / "cache" / "dictionaries").iterdir())) == 3
+
+
+def test_dictionaries_are_kept_in_memory_when_the_cache_is_not_writable(tmp_path):
+    (tmp_path / "dictionaries").mkdir()
+    (tmp_path / "dictionaries" / "shop.tsv").write_text("weird\tnormal\nodd hands\tfine hands\n", encoding="utf-8")
+    (tmp_path / "file").write_text("")
+    store = flux_dictionaries.DictionaryStore(str(tmp_path / "dictionaries"), str(tmp_path / "file" / "cache"))
+    dictionary = store.load("ugly:pretty")
+    assert dictionary.get("weird") == "normal" and dictionary.get("ugly") == "pretty" and dictionary.get("x") is None
+    assert len(dictionary) == 3
+    assert dictionary.phrase_handler.replace_phrases("odd hands, weird")[0] == "fine hands, weird"
+    assert store.load("").directory is dictionary.directory  # not recompiled until a file changes
+
+
+def test_overlapping_phrases_match_leftmost_longest():
+    handler = flux_utils.PhraseHandler({"low quality": "high quality", "low quality image": "great image",
+                                        "quality image artifacts": "clean image"})
+    prompt = flux_utils.PromptTokens("very low quality image artifacts")
+    assert [match[:3] for match in handler.token_matches(prompt)] == [(1, 4, "low quality image")]
+    assert handler.replace_phrases("very low quality image artifacts")[0] == "very great image artifacts"
+    assert handler.replace_phrases("low quality, quality image artifacts")[0] == "high quality, clean image"
+
+
+def test_later_layers_override_earlier_ones():
+    assert flux_utils.builtin_phrases["bad anatomy"] != "fine anatomy"
+    handler = flux_utils.PhraseHandler({"bad anatomy": "fine anatomy"})
+    assert handler.replace_phrases("bad anatomy, blurry")[0] == "fine anatomy, blurry"
+    handler.add_phrases({"bad anatomy": "perfect anatomy"})
+    assert [match[3] for match in handler.token_matches(flux_utils.PromptTokens("bad anatomy"))] == ["perfect anatomy"]
+    assert flux_utils.PhraseHandler(base=handler).phrase_map["bad anatomy"] == "perfect anatomy"
+    assert flux_utils.PhraseHandler().replace_phrases("bad anatomy")[0] == flux_utils.builtin_phrases["bad anatomy"]
+
+
+def test_phrases_only_match_whole_words():
+    handler = flux_utils.PhraseHandler({"smug": "humble"})
+    text = "smugly grinning, smug-looking, smugsmile"
+    assert handler.replace_phrases(text)[0] == text
+    assert list(handler.token_matches(flux_utils.PromptTokens("smugly"))) == []
+    assert handler.replace_phrases("a smug grin, smug")[0] == "a humble grin, humble"
+
+def test_decimal_weights_are_one_token():
+    assert flux_utils.phrase_tokens("(worst quality:1.4)") == ["(", "worst", "quality", ":", "1.4", ")"]
+    assert flux_utils.phrase_tokens("x1.5, 2.5x, 3.") == ["x1", ".", "5", ",", "2.5", "x", ",", "3", "."]
+
+
+def test_emphasised_tags_are_split_from_their_weight():
+    prompt = flux_utils.PromptTokens("(worst quality:1.4), ( blurry : 2 ), (a (b):1.1), (plain), x:1.2")
+    assert [flux_utils.split_emphasis(tag, tokens) for tag, tokens in prompt.tags()] == [
+        ("worst quality", ["worst", "quality"], 1.4), ("blurry", ["blurry"], 2.0),
+        ("(a (b):1.1)", ["(", "a", "(", "b", ")", ":", "1.1", ")"], None), ("(plain)", ["(", "plain", ")"], None),
+        ("x:1.2", ["x", ":", "1.2"], None)]
+
+
+def test_existing_weights_are_kept_on_the_antonyms(engine):
+    negative = "(blurry:1.4), (worst quality:1.4), (ugly face: 0.8)"
+    results = {complexity: engine.run_batch([("a cat", negative)], 0.5, complexity, "default", use_llm_fallback=True)[0]
+               for complexity in ("basic", "advanced", "expert")}
+    for result, llm_input in results.values():
+        assert result.startswith("a cat, (sharp:1.4), ")
+        assert llm_input.endswith("\n\n(worst quality:1.4)")
+        assert "\\(" not in result and "1 . 4" not in result
+    # Expert mode uses the written weight instead of the computed one; expansions get half of its boost
+    assert results["expert"][0].startswith("a cat, (sharp:1.4), (##s:1.2), ")
@@ -0,0 +1,46 @@
+# tests/test_sentiment.py
+#
+# The built-in lexicon replaced TextBlob, so it must rank prompts by polarity the way TextBlob does.
+import statistics
+
+import pytest
+
+from flux_pseudo_negative.flux_sentiment import sentiment_lexicon
+
+MIN_SENTIMENT_RANK_CORRELATION = 0.75  # Spearman, over the corpus tags and prompts
+
+
+def ranks(values):
+    order = sorted(range(len(values)), key=values.__getitem__)
+    result = [0.0] * len(values)
+    start = 0
+    while start < len(order):
+        end = start
+        while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+            end += 1
+        for position in range(start, end + 1):
+            result[order[position]] = (start + end) / 2  # ties share their average rank
+        start = end + 1
+    return result
+
+
+def spearman(a, b):
+    ranks_a, ranks_b = ranks(a), ranks(b)
+    mean_a, mean_b = statistics.fmean(ranks_a), statistics.fmean(ranks_b)
+    covariance = sum((x - mean_a) * (y - mean_b) for x, y in zip(ranks_a, ranks_b))
+    spread = (sum((x - mean_a) ** 2 for x in ranks_a) * sum((y - mean_b) ** 2 for y in ranks_b)) ** 0.5
+    return covariance / spread if spread else 1.0
+
+
+def test_spearman_handles_ties():
+    assert spearman([1, 2, 2, 3], [10, 20, 20, 30]) == pytest.approx(1.0)
+    assert spearman([1, 2, 3], [3, 2, 1]) == pytest.approx(-1.0)
+
+
+def test_lexicon_ranks_like_textblob(corpus):
+    textblob = pytest.importorskip("textblob")
+    texts = list(dict.fromkeys([tag.strip() for prompt in corpus for tag in prompt["negative"].split(",")
+                                if tag.strip()] + [prompt["negative"] for prompt in corpus]))
+    correlation = spearman([textblob.TextBlob(text).sentiment.polarity for text in texts],
+                           [sentiment_lexicon.score(text) for text in texts])
+    assert correlation >= MIN_SENTIMENT_RANK_CORRELATION
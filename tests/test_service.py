@@ -0,0 +1,81 @@
+# tests/test_service.py
+#
+# Prompts posted to the HTTP service from many keep-alive connections are batched together;
+# every response must still match the node's output for that prompt alone.
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from flux_pseudo_negative import NODE_CLASS_MAPPINGS, flux_server
+from conftest import clear_caches
+
+COMPLEXITIES = ["basic", "advanced", "expert"]
+SERVICE_THREADS = 16  # concurrent client connections
+
+
+@pytest.fixture
+def server(engine):
+    server = flux_server.ConversionServer(engine, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(connection, body, headers=None):
+    connection.request("POST", "/convert", body, {"Content-Type": "application/json", **(headers or {})})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_service_responses_match_the_node(server, corpus):
+    node = NODE_CLASS_MAPPINGS["FluxPseudoNegativeNode"]()
+    jobs = [(prompt["negative"], prompt["positive"], complexity) for prompt in corpus for complexity in COMPLEXITIES]
+    expected = {job: list(node.run(job[0], job[1], 0.5, job[2], "default")[:2]) for job in jobs}
+    clear_caches()
+
+    def post_all(thread_jobs):
+        # One keep-alive connection per client thread
+        connection = http.client.HTTPConnection(*server.server_address[:2])
+        outputs = []
+        for negative, positive, complexity in thread_jobs:
+            _, response = post(connection, json.dumps(
+                {"negative_prompt": negative, "positive_prompt": positive, "complexity": complexity}))
+            outputs.append([response.get("modified_prompt"), response.get("llm_input")])
+        connection.close()
+        return outputs
+
+    schedule = [jobs[i::SERVICE_THREADS] for i in range(SERVICE_THREADS)]
+    with ThreadPoolExecutor(max_workers=SERVICE_THREADS) as executor:
+        outputs = list(executor.map(post_all, schedule))
+    mismatches = [job for thread_jobs, thread_outputs in zip(schedule, outputs)
+                  for job, output in zip(thread_jobs, thread_outputs) if output != expected[job]]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", "1.5"])
+def test_invalid_content_length_is_rejected(server, length):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    connection.putrequest("POST", "/convert")
+    connection.putheader("Content-Length", length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read())["error"]
+    connection.close()
+
+
+def test_unknown_record_keys_are_rejected(server, engine):
+    with pytest.raises(ValueError, match="complexty"):
+        engine.convert_records([{"negative_prompt": "blurry", "complexty": "expert"}])
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    status, response = post(connection, json.dumps({"negative_prompt": "blurry", "complexty": "expert"}))
+    assert status == 400 and "complexty" in response["error"]
+    status, response = post(connection, json.dumps({"prompts": [{"negative_prompt": "blurry"}], "complexty": "expert"}))
+    assert status == 400 and "complexty" in response["error"]
+    status, response = post(connection, json.dumps({"negative_prompt": "blurry", "complexity": "expert"}))
+    assert status == 200 and "modified_prompt" in response
+    connection.close()
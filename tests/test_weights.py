@@ -0,0 +1,49 @@
+# tests/test_weights.py
+#
+# Prompt weights for expert mode and the `(tag:weight)` emphasis syntax they are written in.
+import pytest
+
+from flux_pseudo_negative import flux_utils
+
+
+def test_weights_grow_with_intensity_strength_and_sentiment():
+    weights = flux_utils.prompt_weights([0.0, 0.5, 1.0], -1.0, 1.0)
+    assert weights == [1.0, 1.25, 1.5]
+    assert flux_utils.prompt_weights([1.0], 0.0, 1.0) == [1.25]  # a neutral prompt gets half the boost
+    assert flux_utils.prompt_weights([1.0], 0.6, 1.0) == flux_utils.prompt_weights([1.0], -0.6, 1.0) == [1.4]
+    assert flux_utils.prompt_weights([0.3, 1.0], -0.8, 0.0) == [1.0, 1.0]
+    assert flux_utils.prompt_weights([], -1.0, 1.0) == []
+    assert all(isinstance(weight, float) for weight in weights)
+
+
+def test_weighted_tags_escape_brackets_and_backslashes():
+    assert flux_utils.weighted_tag("sharp", 1.25) == "(sharp:1.25)"
+    assert flux_utils.weighted_tag("sharp", 1.5) == "(sharp:1.5)"
+    assert flux_utils.weighted_tag("natural (beautiful)", 1.1) == r"(natural \(beautiful\):1.1)"
+    assert flux_utils.weighted_tag(r"back\slash", 1.1) == r"(back\\slash:1.1)"
+    assert flux_utils.weighted_tag(r"\(a)", 1.1) == r"(\\\(a\):1.1)"
+
+
+@pytest.mark.parametrize("tag", ["sharp", "natural (beautiful)", r"back\slash"])
+def test_a_weight_of_one_leaves_the_tag_unchanged(tag):
+    assert flux_utils.weighted_tag(tag, 1.0) == tag
+    assert flux_utils.weighted_tag(tag, 1) == tag
+
+
+def test_expert_output_weights_antonyms_and_half_weights_their_expansions(engine, monkeypatch):
+    monkeypatch.setattr(engine, "expand_concept", lambda state, antonym: [antonym, f"very {antonym}"])
+    state = engine.conversion_state()
+    result = engine.expert_processing(state, ["sharp", "light (soft)"], "a cat", [1.3, 1.0])
+    assert result == "a cat, (sharp:1.3), (very sharp:1.15), light (soft), very light (soft)"
+    assert engine.expert_processing(state, ["sharp"], "a cat") == "a cat, sharp, very sharp"
+
+
+def test_expert_runs_weight_antonyms_by_strength(engine):
+    weights = [flux_utils.prompt_weights([flux_utils.tag_intensity("blurry")], engine.analyze_sentiment(
+        "blurry", ["blurry"]), strength)[0] for strength in (0.0, 0.5, 1.0)]
+    results = [engine.run_batch([("a cat", "blurry")], strength, "expert", "default")[0][0]
+               for strength in (0.0, 0.5, 1.0)]
+    assert results[0].startswith("a cat, sharp, ") and "(" not in results[0]
+    assert weights[0] == 1.0 < weights[1] < weights[2]
+    for weight, result in zip(weights[1:], results[1:]):
+        assert result.startswith(f"a cat, (sharp:{weight:g}), ")
@@ -0,0 +1,31 @@
+# tests/test_wordnet.py
+from collections import Counter
+
+import pytest
+
+import conftest
+from flux_pseudo_negative import flux_wordnet
+from conftest import ADJECTIVES, WORDNET_ANTONYMS
+
+
+def test_modifier_words_are_read_from_the_installed_list(tmp_path):
+    path = flux_wordnet.build_modifier_words(str(tmp_path / "modifier_words.txt"))
+    assert flux_wordnet.modifier_words(path) == ADJECTIVES
+
+
+def test_missing_modifier_words_are_reported_instead_of_built(tmp_path):
+    with pytest.raises(LookupError, match="install.py"):
+        flux_wordnet.modifier_words(str(tmp_path / "modifier_words.txt"))
+
+
+@pytest.mark.parametrize("word", ["dark", "good", "old", "light", "Dark", "darker", "darkest", "lows", "blurred",
+                                  "worst", "worse", "better", "blurry", "watermark"])
+def test_index_matches_the_live_synset_walk(tmp_path, monkeypatch, word):
+    import nltk.corpus
+
+    monkeypatch.setitem(WORDNET_ANTONYMS, "blur", [["focus"]])
+    monkeypatch.setattr(conftest, "ADJECTIVES", ADJECTIVES | {"blur"})
+    index = flux_wordnet.WordNetAntonymIndex(flux_wordnet.build_wordnet_index(str(tmp_path / "antonyms.fpnt")))
+    antonyms, firsts = flux_wordnet.antonym_lists(nltk.corpus.wordnet, word)
+    assert index.lookup(word) == ((flux_wordnet.most_common(antonyms), firsts[0]) if antonyms else None)
+    assert index.counts(word) == dict(Counter(antonyms))